@@ -8,13 +8,17 @@ from django.contrib.admin.sites import NotRegistered
 from django.utils.translation import ugettext_lazy as _
 from django.utils.timezone import localtime
 from django.conf import settings
+from django.db import transaction
 from django.db.models import Q
 
 from daterange_filter.filter import DateRangeFilter
 from wagtail.contrib.modeladmin.options import ModelAdmin as WagtailModelAdmin
+from molo.profiles import answer_hashers
+from molo.profiles.admin_import_export import ProfileExportMixin
 from molo.profiles.admin_views import FrontendUsersAdminView
 from molo.profiles.models import (
-    UserProfile, SecurityQuestion, SecurityAnswer, SecurityQuestionIndexPage)
+    UserProfile, SecurityQuestion, SecurityAnswer, SecurityQuestionIndexPage,
+    DailyUserStats, forget_absent_usernames, index_search_terms)
 
 from import_export.admin import ImportExportModelAdmin
 from import_export.fields import Field
@@ -124,9 +128,12 @@ class FrontendUsersModelAdmin(WagtailModelAdmin, ProfileUserAdmin):
         CustomUsersListFilter)
 
     search_fields = ('username',)
+    keyset_pagination = True
 
     def get_queryset(self, request):
-        return User.objects.filter(profile__site=request.site)
+        return User.objects.filter(
+            profile__site=request.site).select_related(
+            'profile', 'profile__site')
 
 
 class UserProfileModelAdmin(WagtailModelAdmin, ProfileUserAdmin):
@@ -144,6 +151,19 @@ class UserProfileModelAdmin(WagtailModelAdmin, ProfileUserAdmin):
         return UserProfile.objects.all()
 
 
+class DailyUserStatsModelAdmin(WagtailModelAdmin):
+    model = DailyUserStats
+    menu_label = 'User Stats'
+    menu_icon = 'user'
+    menu_order = 600
+    add_to_settings_menu = True
+    list_display = ('date', 'total_users', 'new_users', 'returning_users',
+                    'active_users')
+
+    def get_queryset(self, request):
+        return DailyUserStats.objects.filter(site=request.site)
+
+
 class TzDateTimeWidget(DateTimeWidget):
 
     def render(self, value, obj):
@@ -152,7 +172,40 @@ class TzDateTimeWidget(DateTimeWidget):
         return super(TzDateTimeWidget, self).render(value, obj)
 
 
-class MultiSiteUserResource(ModelResource):
+class SecurityQuestionIndex(object):
+    """
+    The security questions of each site by title.
+
+    Imports resolve the question of every answer of every row, so the
+    questions of a site are loaded once and questions created during the
+    import are added to the index as they are created.
+    """
+
+    def __init__(self):
+        self.sites = {}
+
+    def get_questions(self, site):
+        if site.pk not in self.sites:
+            security_index = SecurityQuestionIndexPage.objects.descendant_of(
+                site.root_page).first()
+            questions = {}
+            for question in SecurityQuestion.objects.descendant_of(
+                    security_index).order_by('pk'):
+                questions.setdefault(question.title, question)
+            self.sites[site.pk] = (security_index, questions)
+        return self.sites[site.pk]
+
+    def get_or_create(self, site, title):
+        security_index, questions = self.get_questions(site)
+        if title not in questions:
+            question = SecurityQuestion(title=title)
+            security_index.add_child(instance=question)
+            question.save_revision().publish()
+            questions[title] = question
+        return questions[title]
+
+
+class MultiSiteUserResource(ProfileExportMixin, ModelResource):
     date_of_birth = Field(
         'profile__date_of_birth', 'date_of_birth', widget=DateWidget())
     alias = Field('profile__alias', 'alias')
@@ -167,6 +220,8 @@ class MultiSiteUserResource(ModelResource):
         'date_joined', 'date_joined', widget=TzDateTimeWidget())
     site = Field('profile__site__pk', 'site')
 
+    export_prefetch_related = ('profile__securityanswer_set__question', )
+
     class Meta:
         model = User
         exclude = ('id', 'is_superuser', 'groups',
@@ -212,27 +267,46 @@ class MultiSiteUserResource(ModelResource):
         row_result.import_type = RowResult.IMPORT_TYPE_SKIP
         return row_result
 
+    def before_import(self, dataset, using_transactions, dry_run, **kwargs):
+        # start every import with an empty index, a dry run rolls back the
+        # questions it created
+        self.question_index = SecurityQuestionIndex()
+        self.sites = {}
+
+    def get_site(self, pk):
+        if not hasattr(self, 'sites'):
+            self.sites = {}
+        pk = int(pk)
+        if pk not in self.sites:
+            self.sites[pk] = Site.objects.get(pk=pk)
+        return self.sites[pk]
+
+    def get_security_question(self, site, title):
+        """
+        Get the site's security question with this title, creating it if
+        it doesn't already exist.
+        """
+        if not hasattr(self, 'question_index'):
+            self.question_index = SecurityQuestionIndex()
+        return self.question_index.get_or_create(site, title)
+
     def import_field(self, field, obj, data):
         if field.attribute == 'profile__security_question_answers':
-            site = Site.objects.get(pk=data.get('site'))
-            security_index = SecurityQuestionIndexPage.objects.descendant_of(
-                site.root_page).first()
+            site = self.get_site(data.get('site'))
             for x in data['security_question_answers']:
                 # create the security question if it doesn't already exist
-                sq = SecurityQuestion.objects.descendant_of(
-                    security_index).filter(title=x[0])
-                if not sq.exists():
-                    sq = SecurityQuestion(title=x[0])
-                    security_index.add_child(instance=sq)
-                    sq.save_revision().publish()
-                else:
-                    sq = sq.first()
+                sq = self.get_security_question(site, x[0])
 
                 # create the securty answer
                 answer = SecurityAnswer(
                     question=sq, answer=x[1], user=obj.profile)
-                # save separately so that we can pass in is_import
-                answer.save(is_import=True)
+                # save separately so that we can pass in is_import, answers
+                # are exported hashed but hand written imports may not be
+                answer.save(is_import=answer_hashers.is_answer_hashed(x[1]))
+        elif field.attribute == 'profile__site__pk':
+            # the site is set in import_obj, writing the pk through the
+            # relation would change the pk of the site we've cached
+            return
         else:
             super(MultiSiteUserResource, self).import_field(field, obj, data)
 
@@ -240,7 +314,7 @@ class MultiSiteUserResource(ModelResource):
         self.import_field(self.fields['username'], obj, data)
         obj.save()
         if data.get('site'):
-            obj.profile.site = Site.objects.get(pk=data.get('site'))
+            obj.profile.site = self.get_site(data.get('site'))
             obj.profile.save()
         super(MultiSiteUserResource, self).import_obj(obj, data, dry_run)
 
@@ -248,6 +322,115 @@ class MultiSiteUserResource(ModelResource):
         # Save related models
         instance.profile.save()
 
+    def bulk_import(self, dataset, batch_size=1000, progress=None):
+        """
+        Import the users in the dataset with batched bulk inserts.
+
+        Much faster than import_data() for large migrations, but the
+        per-row import hooks and the user post_save signal are skipped.
+        Like import_row(), users that already exist are never updated.
+
+        progress, if given, is called after every batch with the number
+        of rows processed, the number of users imported and the total
+        number of rows. Returns the number of users imported.
+        """
+        self.before_import(dataset, True, False)
+        rows = dataset.dict
+        total = len(rows)
+        for row in rows:
+            row['username'] = self.get_prefixed_username(row)
+
+        usernames = [row['username'] for row in rows]
+        existing = set()
+        for start in range(0, total, batch_size):
+            existing.update(User.objects.filter(
+                username__in=usernames[start:start + batch_size]
+            ).values_list('username', flat=True))
+
+        self.sites.update(Site.objects.in_bulk(
+            set(int(row['site']) for row in rows if row.get('site'))))
+        default_site = Site.objects.filter(is_default_site=True).first()
+
+        imported = 0
+        for start in range(0, total, batch_size):
+            batch = []
+            for row in rows[start:start + batch_size]:
+                if row['username'] not in existing:
+                    existing.add(row['username'])
+                    batch.append(row)
+            if batch:
+                with transaction.atomic():
+                    self.bulk_import_batch(batch, default_site)
+            imported += len(batch)
+            if progress is not None:
+                progress(min(start + batch_size, total), imported, total)
+        return imported
+
+    def bulk_import_batch(self, rows, default_site):
+        user_fields = []
+        profile_fields = []
+        for field in self.get_fields():
+            if field.readonly or not field.attribute:
+                continue
+            if '__' not in field.attribute:
+                user_fields.append(field)
+            elif field.attribute.count('__') == 1 and \
+                    field.attribute != 'profile__security_question_answers':
+                profile_fields.append(field)
+
+        users = []
+        for row in rows:
+            user = User()
+            for field in user_fields:
+                if field.column_name in row:
+                    field.save(user, row)
+            users.append(user)
+        User.objects.bulk_create(users)
+        # bulk_create only sets primary keys on postgres
+        user_ids = dict(User.objects.filter(
+            username__in=[u.username for u in users]
+        ).values_list('username', 'pk'))
+
+        profiles = []
+        answers = []
+        for row, user in zip(rows, users):
+            profile = UserProfile(user_id=user_ids[user.username])
+            for field in profile_fields:
+                if field.column_name in row:
+                    setattr(
+                        profile, field.attribute.split('__')[1],
+                        field.clean(row))
+            if row.get('site'):
+                profile.site = self.get_site(row['site'])
+            else:
+                profile.site = default_site
+            profiles.append(profile)
+
+            for title, answer in row.get('security_question_answers') or []:
+                answers.append(SecurityAnswer(
+                    user_id=profile.pk, answer=answer,
+                    question=self.get_security_question(profile.site, title)))
+
+        # answers are exported hashed and stored as is, any that aren't are
+        # hashed together
+        unhashed = [
+            answer for answer in answers
+            if not answer_hashers.is_answer_hashed(answer.answer)]
+        for answer, hashed in zip(unhashed, answer_hashers.make_answers(
+                answer.answer for answer in unhashed)):
+            answer.answer = hashed
+        UserProfile.objects.bulk_create(profiles)
+        SecurityAnswer.objects.bulk_create(answers)
+
+        # bulk inserts don't send the signals that would do this
+        usernames = {}
+        for user, profile in zip(users, profiles):
+            usernames.setdefault(profile.site_id, []).extend(
+                [user.username, profile.migrated_username])
+        for site_id, site_usernames in usernames.items():
+            forget_absent_usernames(site_id, site_usernames)
+        index_search_terms(zip(profiles, [user.username for user in users]))
+
 
 @admin.register(User)
 class ProfilesUserAdmin(ImportExportModelAdmin, ProfileUserAdmin):
@@ -1,9 +1,57 @@
+import csv
+
+import tablib
 from import_export import resources
 from django.contrib.auth.models import User
+from django.db.models.query import QuerySet
 from import_export.fields import Field
 
+from molo.profiles.utils import encode_csv_row, queryset_iterator
+
+
+class ProfileExportMixin(object):
+    """
+    Applies a fixed prefetch plan to every export queryset so that the
+    dehydrate_ methods read the profile (and its site) from the joined row
+    instead of issuing queries per user.
+    """
+    export_select_related = ('profile', 'profile__site')
+    export_prefetch_related = ()
+    export_chunk_size = 2000
+
+    def get_export_queryset(self, queryset):
+        return queryset.select_related(
+            *self.export_select_related).prefetch_related(
+            *self.export_prefetch_related)
+
+    def get_queryset(self):
+        return self.get_export_queryset(
+            super(ProfileExportMixin, self).get_queryset())
+
+    def iter_export_queryset(self, queryset, chunk_size=None):
+        if not isinstance(queryset, QuerySet):
+            return iter(queryset)
+        # prefetch_related is ignored by QuerySet.iterator(), so fetch
+        # the rows in chunks instead
+        return queryset_iterator(
+            self.get_export_queryset(queryset),
+            chunk_size or self.export_chunk_size)
 
-class FrontendUsersResource(resources.ModelResource):
+    def export(self, queryset=None, *args, **kwargs):
+        self.before_export(queryset, *args, **kwargs)
+
+        if queryset is None:
+            queryset = self.get_queryset()
+        data = tablib.Dataset(headers=self.get_export_headers())
+        for obj in self.iter_export_queryset(queryset):
+            data.append(self.export_resource(obj))
+
+        self.after_export(queryset, data, *args, **kwargs)
+
+        return data
+
+
+class FrontendUsersResource(ProfileExportMixin, resources.ModelResource):
     # see dehydrate_ functions below
     date_of_birth = Field()
     alias = Field()
@@ -28,3 +76,13 @@ class FrontendUsersResource(resources.ModelResource):
 
     def dehydrate_mobile_number(self, user):
         return user.profile.mobile_number if hasattr(user, 'profile') else ''
+
+    def export_to_file(self, queryset, fileobj, chunk_size=None):
+        """
+        Write the queryset to fileobj as CSV, one chunk of users at a time,
+        so that memory use stays flat however many users are exported.
+        """
+        writer = csv.writer(fileobj)
+        writer.writerow(encode_csv_row(self.get_export_headers()))
+        for user in self.iter_export_queryset(queryset, chunk_size):
+            writer.writerow(encode_csv_row(self.export_resource(user)))
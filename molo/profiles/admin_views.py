@@ -1,13 +1,25 @@
 from wagtail.contrib.modeladmin.views import IndexView
 from wagtail.wagtailadmin import messages
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
 from django.utils.translation import ugettext as _
-from task import send_export_email
+from molo.profiles.models import UserProfilesSettings, filter_by_search_terms
+from molo.profiles.utils import estimate_count
+from task import (
+    get_export_storage, read_export_token, send_export_email)
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core import signing
+from django.http import FileResponse, Http404
 from django.shortcuts import redirect
 
 
 class FrontendUsersAdminView(IndexView):
-    def send_export_email_to_celery(self, email, arguments):
-        send_export_email.delay(email, arguments)
+    AFTER_VAR = 'after'
+    BEFORE_VAR = 'before'
+
+    def send_export_email_to_celery(self, email, arguments, user_id=None):
+        send_export_email.delay(email, arguments, user_id)
 
     def post(self, request, *args, **kwargs):
         if not request.user.email:
@@ -33,10 +45,134 @@ class FrontendUsersAdminView(IndexView):
         for key, value in filter_list.items():
             if value:
                 arguments[key] = value
-        self.send_export_email_to_celery(request.user.email, arguments)
+        self.send_export_email_to_celery(
+            request.user.email, arguments, request.user.pk)
         messages.success(request, _(
             "CSV emailed to '{0}'").format(request.user.email))
         return redirect(request.path)
 
+    def get_queryset(self, request=None):
+        # the cursors aren't lookups, and filtering or searching starts
+        # again from the first page
+        for var in (self.AFTER_VAR, self.BEFORE_VAR):
+            self.params.pop(var, None)
+        return super(FrontendUsersAdminView, self).get_queryset(request)
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Find users by the start of their username, migrated username,
+        alias or mobile number, using the indexed search terms.
+        """
+        if not search_term:
+            return queryset, False
+        country_code = UserProfilesSettings.for_site(
+            request.site).country_code
+        return filter_by_search_terms(
+            queryset, search_term, country_code), False
+
+    def use_keyset_pagination(self):
+        """
+        Users are paged through newest first by (date_joined, pk), so each
+        page is fetched from the index however deep it is. Lists ordered
+        by one of their columns are paged by offset.
+        """
+        return getattr(self.model_admin, 'keyset_pagination', False) and \
+            self.ORDER_VAR not in self.params
+
+    def get_cursor(self, var):
+        date_joined, _sep, pk = self.request.GET.get(var, '').rpartition('_')
+        try:
+            date_joined = parse_datetime(date_joined)
+            pk = int(pk)
+        except ValueError:
+            return None
+        if date_joined is None:
+            return None
+        return date_joined, pk
+
+    def make_cursor(self, obj):
+        return '%s_%s' % (obj.date_joined.isoformat(), obj.pk)
+
+    def get_keyset_page(self, queryset):
+        size = self.items_per_page
+        before = self.get_cursor(self.BEFORE_VAR)
+        after = self.get_cursor(self.AFTER_VAR)
+        if before:
+            date_joined, pk = before
+            object_list = list(queryset.filter(
+                Q(date_joined__gt=date_joined) |
+                Q(date_joined=date_joined, pk__gt=pk)).order_by(
+                'date_joined', 'pk')[:size + 1])
+            has_previous = len(object_list) > size
+            object_list = object_list[:size][::-1]
+            has_next = True
+        else:
+            if after:
+                date_joined, pk = after
+                queryset = queryset.filter(
+                    Q(date_joined__lt=date_joined) |
+                    Q(date_joined=date_joined, pk__lt=pk))
+            object_list = list(
+                queryset.order_by('-date_joined', '-pk')[:size + 1])
+            has_next = len(object_list) > size
+            object_list = object_list[:size]
+            has_previous = after is not None
+
+        previous_url = next_url = None
+        if object_list and has_previous:
+            previous_url = self.get_query_string(
+                {self.BEFORE_VAR: self.make_cursor(object_list[0])})
+        if object_list and has_next:
+            next_url = self.get_query_string(
+                {self.AFTER_VAR: self.make_cursor(object_list[-1])})
+        return object_list, previous_url, next_url
+
+    def get_context_data(self, **kwargs):
+        if not self.use_keyset_pagination():
+            return super(FrontendUsersAdminView, self).get_context_data(
+                **kwargs)
+
+        estimated_count = getattr(
+            settings, 'PROFILES_ADMIN_ESTIMATED_COUNT', False)
+        object_list, previous_url, next_url = self.get_keyset_page(
+            self.queryset)
+        context = {
+            'view': self,
+            # only used to tell whether there are any users at all
+            'all_count': bool(object_list) or
+            self.get_base_queryset().exists(),
+            'result_count': estimate_count(self.queryset)
+            if estimated_count else self.queryset.count(),
+            'estimated_count': estimated_count,
+            'keyset_pagination': True,
+            'object_list': object_list,
+            'previous_url': previous_url,
+            'next_url': next_url,
+            'user_can_create': self.permission_helper.user_can_create(
+                self.request.user),
+        }
+        context.update(kwargs)
+        # skips IndexView's offset pagination and counts
+        return super(IndexView, self).get_context_data(**context)
+
     def get_template_names(self):
         return 'admin/frontend_users_admin_view.html'
+
+
+@staff_member_required
+def export_download(request, token):
+    """
+    Serve a stored export to the staff member it was made for, until its
+    token expires.
+    """
+    try:
+        name, user_id = read_export_token(token)
+    except signing.BadSignature:
+        raise Http404
+    storage = get_export_storage()
+    if user_id not in (None, request.user.pk) or not storage.exists(name):
+        raise Http404
+    response = FileResponse(storage.open(name))
+    response['Content-Disposition'] = 'attachment; filename="%s"' % (
+        name.split('_', 1)[-1], )
+    return response
@@ -0,0 +1,78 @@
+import copy
+from contextlib import closing
+from multiprocessing import Pool
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+# below this many answers starting the processes costs more than it saves
+POOL_THRESHOLD = 100
+
+
+def get_answer_hasher():
+    """
+    The hasher for security answers, the same as for passwords unless
+    configured otherwise.
+
+    ``PROFILES_SECURITY_ANSWER_HASHER`` picks the algorithm (one of
+    ``PASSWORD_HASHERS``) and ``PROFILES_SECURITY_ANSWER_WORK_FACTOR``
+    overrides its iterations or rounds. Answers are easy to guess, so a
+    leaked hash with a lower work factor is cracked all the sooner.
+    Lowering it only saves CPU on registrations, imports and password
+    recovery, and is a trade-off for the site's operator to make.
+    """
+    hasher = hashers.get_hasher(
+        getattr(settings, 'PROFILES_SECURITY_ANSWER_HASHER', 'default'))
+    work_factor = getattr(
+        settings, 'PROFILES_SECURITY_ANSWER_WORK_FACTOR', None)
+    if work_factor:
+        hasher = copy.copy(hasher)
+        if hasattr(hasher, 'iterations'):
+            hasher.iterations = work_factor
+        elif hasattr(hasher, 'rounds'):
+            hasher.rounds = work_factor
+    return hasher
+
+
+def normalise_answer(raw_answer):
+    return raw_answer.strip().lower()
+
+
+def make_answer(raw_answer):
+    return hashers.make_password(
+        normalise_answer(raw_answer), hasher=get_answer_hasher())
+
+
+def make_answers(raw_answers, processes=None):
+    """
+    Hash many answers, spread over a pool of processes when there are
+    enough of them to make it worthwhile.
+    """
+    raw_answers = list(raw_answers)
+    if processes is None:
+        processes = getattr(
+            settings, 'PROFILES_SECURITY_ANSWER_HASH_PROCESSES', None)
+    if processes == 1 or len(raw_answers) < POOL_THRESHOLD:
+        return [make_answer(raw_answer) for raw_answer in raw_answers]
+    with closing(Pool(processes)) as pool:
+        return pool.map(make_answer, raw_answers)
+
+
+def check_answer(raw_answer, encoded, setter=None):
+    """
+    Check an answer against its hash. The setter is called with the
+    answer to rehash it when it was hashed with another hasher or work
+    factor than the current one.
+    """
+    return hashers.check_password(
+        normalise_answer(raw_answer), encoded, setter,
+        preferred=get_answer_hasher())
+
+
+def is_answer_hashed(answer):
+    try:
+        hashers.identify_hasher(answer)
+    except ValueError:
+        return False
+    return True
@@ -1,5 +1,9 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
 from molo.core.backends import MoloModelBackend
+from molo.profiles.models import absent_username_key
 
 UserModel = get_user_model()
 
@@ -9,15 +13,48 @@ class MoloProfilesModelBackend(MoloModelBackend):
     def authenticate(self, request, username=None, password=None, **kwargs):
         if username is None:
             username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None:
+            return super(MoloProfilesModelBackend, self).authenticate(
+                request=request, username=username, password=password,
+                **kwargs)
+
+        # usernames recently found not to exist on the site are turned away
+        # without a query
+        absent_key = absent_username_key(request.site.pk, username)
+        absent = cache.get(absent_key)
+        user = migrated_user = None
+        if not absent:
+            # the native username is unique and indexed, so it's tried
+            # first, falling back to the (site, migrated_username) index
+            users = UserModel._default_manager.filter(
+                profile__site=request.site)
+            user = users.filter(username=username).first()
+            if user is not None and user.check_password(password):
+                return user
+            migrated_user = users.filter(
+                profile__migrated_username=username).first()
+            if migrated_user is not None and \
+                    migrated_user.check_password(password):
+                return migrated_user
+
+        if user is None and migrated_user is None:
+            if not absent:
+                cache.set(absent_key, True, getattr(
+                    settings, 'PROFILES_ABSENT_USERNAME_CACHE_TIMEOUT', 300))
+            # hash the password anyway so unknown usernames cost the same
+            # as wrong passwords
+            UserModel().set_password(password)
+        # stop here, the other backends can't find the user on this site
+        # either and would only hash the password again
+        raise PermissionDenied
+
 
-        if username is not None:
-            try:
-                user = UserModel.objects.get(
-                    profile__migrated_username=username,
-                    profile__site=request.site)
-                username = user.username
-            except UserModel.DoesNotExist:
-                UserModel().set_password(password)
-
-        return super(MoloProfilesModelBackend, self).authenticate(
-            request=request, username=username, password=password, **kwargs)
+def get_registration_backend():
+    """
+    The backend newly registered users are logged in with, without going
+    through authenticate() and checking the password we've just hashed.
+    """
+    backend = 'molo.profiles.backends.MoloProfilesModelBackend'
+    if backend in settings.AUTHENTICATION_BACKENDS:
+        return backend
+    return settings.AUTHENTICATION_BACKENDS[0]
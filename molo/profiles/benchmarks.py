@@ -0,0 +1,364 @@
+"""
+Benchmarks for the hot paths in molo.profiles.
+
+Run them with ``./manage.py profiles_benchmark <name>``.
+"""
+import gc
+import random
+import re
+import string
+import time
+from collections import OrderedDict
+
+import tablib
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import CommandError
+from django.core.urlresolvers import reverse
+from django.db import connection, transaction
+from django.test import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from wagtail.wagtailcore.models import Site
+
+from molo.profiles.content_filter import (
+    REGEX_EMAIL, REGEX_PHONE, ContentFilter)
+from molo.profiles.backends import MoloProfilesModelBackend
+from molo.profiles.models import (
+    SecurityAnswer, SecurityQuestion, SecurityQuestionIndexPage,
+    UserProfile, UserProfilesSettings, register_user)
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(func):
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+def synthetic_usernames(count, seed=0):
+    """
+    A repeatable mix of plain usernames, usernames containing digits and
+    usernames that look like phone numbers or email addresses.
+    """
+    rng = random.Random(seed)
+    letters = string.ascii_lowercase
+    usernames = []
+    for i in range(count):
+        name = ''.join(rng.choice(letters) for _ in range(rng.randint(4, 12)))
+        kind = i % 10
+        if kind == 0:
+            name = '0%s' % rng.randint(100000000, 999999999)
+        elif kind == 1:
+            name = '%s@%s.com' % (name, rng.choice(('gmail', 'example')))
+        elif kind < 5:
+            name = '%s%s' % (name, rng.randint(0, 9999))
+        usernames.append(name)
+    return usernames
+
+
+def timed(func, values):
+    start = time.time()
+    for value in values:
+        func(value)
+    return time.time() - start
+
+
+@benchmark
+def username_filter(stdout, count=1000000):
+    """
+    Validations per second of the compiled username filter against
+    searching each raw pattern per call.
+    """
+    usernames = synthetic_usernames(count)
+    content_filter = ContentFilter(
+        prevent_phone=True, prevent_email=True,
+        patterns=(r'admin', r'^mxit'), blocklist=('badword', 'worse'))
+    raw_patterns = (REGEX_PHONE, REGEX_EMAIL, r'admin', r'^mxit')
+
+    def raw_search(value):
+        for pattern in raw_patterns:
+            if re.search(pattern, value):
+                return False
+        return True
+
+    for label, func in (('raw patterns', raw_search),
+                        ('compiled filter', content_filter.is_allowed)):
+        elapsed = timed(func, usernames)
+        stdout.write('%s: %d validations/second' % (
+            label, count / elapsed if elapsed else 0))
+
+
+def forget_cached_rows():
+    """
+    Drop the profile settings and security questions cached while a
+    benchmark ran, they may have been read from rows it rolled back.
+    """
+    for site_id in Site.objects.values_list('pk', flat=True):
+        cache.delete(UserProfilesSettings.cache_key(site_id))
+    SecurityQuestion.new_catalog_version()
+
+
+def rolled_back(func, *args, **kwargs):
+    """
+    Time func inside a transaction that is rolled back afterwards, so
+    benchmarks can write to the database without leaving anything behind.
+    """
+    try:
+        with transaction.atomic():
+            start = time.time()
+            func(*args, **kwargs)
+            elapsed = time.time() - start
+            transaction.set_rollback(True)
+    finally:
+        forget_cached_rows()
+    return elapsed
+
+
+@benchmark
+def user_import(stdout, count=1000):
+    """
+    Rows per second imported by import_data() and by bulk_import().
+    """
+    # imported here, the admin registers models when it is imported
+    from molo.profiles.admin import MultiSiteUserResource
+
+    site = Site.objects.get(is_default_site=True)
+    password = hashers.make_password('1234')
+    dataset = tablib.Dataset(headers=[
+        'username', 'password', 'first_name', 'last_name', 'email',
+        'is_active', 'date_joined', 'alias', 'gender', 'date_of_birth',
+        'mobile_number', 'migrated_username', 'site',
+        'security_question_answers'])
+    for username in synthetic_usernames(count):
+        dataset.append([
+            username, password, '', '', '', '1', '2017-09-07 08:43:18',
+            username, '', '', '', username, site.pk, []])
+
+    for label, func in (
+            ('import_data', MultiSiteUserResource().import_data),
+            ('bulk_import', MultiSiteUserResource().bulk_import)):
+        elapsed = rolled_back(func, dataset)
+        stdout.write('%s: %d rows/second' % (
+            label, count / elapsed if elapsed else 0))
+
+
+def register_user_per_save(site, username, password, email='',
+                           security_answers=(), **profile_fields):
+    """
+    Registration as it used to be done, for comparison with register_user.
+    """
+    user = User.objects.create_user(username=username, password=password)
+    for name, value in profile_fields.items():
+        setattr(user.profile, name, value)
+    user.profile.site = site
+    if email:
+        user.email = email
+        user.save()
+    user.profile.save()
+    for question_id, answer in security_answers:
+        if answer:
+            SecurityAnswer.objects.create(
+                user=user.profile, question_id=question_id, answer=answer)
+    return user
+
+
+@benchmark
+def registration(stdout, count=100):
+    """
+    Queries per registration and registrations per second of
+    register_user against saving the user, profile and answers one at a
+    time.
+    """
+    site = Site.objects.get(is_default_site=True)
+    question_ids = list(SecurityQuestion.objects.descendant_of(
+        site.root_page).values_list('pk', flat=True)[:2])
+    usernames = synthetic_usernames(count)
+
+    def register_all(func):
+        for username in usernames:
+            func(site, username, '1234', email='%s@example.com' % username,
+                 security_answers=[(pk, 'answer') for pk in question_ids],
+                 alias=username, gender='female')
+
+    for label, func in (('per save', register_user_per_save),
+                        ('register_user', register_user)):
+        with CaptureQueriesContext(connection) as queries:
+            elapsed = rolled_back(register_all, func)
+        stdout.write(
+            '%s: %.1f queries/registration, %d registrations/second' % (
+                label, len(queries) / float(count),
+                count / elapsed if elapsed else 0))
+
+
+@benchmark
+def login(stdout, count=1000000, logins=100):
+    """
+    Milliseconds per login by native and by migrated username with count
+    profiles on the site.
+    """
+    site = Site.objects.get(is_default_site=True)
+    password = hashers.make_password('1234')
+    backend = MoloProfilesModelBackend()
+    request = RequestFactory().get('/')
+    request.site = site
+
+    def create_users():
+        for start in range(0, count, 10000):
+            names = ['user%s' % i for i in range(
+                start, min(start + 10000, count))]
+            User.objects.bulk_create([
+                User(username=name, password=password) for name in names])
+            user_ids = User.objects.filter(
+                username__in=names).values_list('pk', flat=True)
+            UserProfile.objects.bulk_create([
+                UserProfile(user_id=pk, site=site,
+                            migrated_username='migrated%s' % pk)
+                for pk in user_ids])
+
+    def log_in(usernames):
+        for username in usernames:
+            assert backend.authenticate(
+                request, username=username, password='1234') is not None
+
+    with transaction.atomic():
+        create_users()
+        sample = list(User.objects.filter(
+            profile__site=site, username__startswith='user').order_by(
+            '?').values_list('username', 'profile__migrated_username')[
+            :logins])
+        for label, index in (('native username', 0),
+                             ('migrated username', 1)):
+            start = time.time()
+            log_in(row[index] for row in sample)
+            elapsed = time.time() - start
+            stdout.write('%s: %.2f ms/login' % (
+                label, elapsed * 1000 / len(sample) if sample else 0))
+        transaction.set_rollback(True)
+
+
+# the profile pages and whether they can be seen without logging in
+PAGES = OrderedDict([
+    ('register', ('molo.profiles:user_register', True)),
+    ('forgot_password', ('molo.profiles:forgot_password', True)),
+    ('done', ('molo.profiles:registration_done', False)),
+    ('viewprofile', ('molo.profiles:view_my_profile', False)),
+    ('editprofile', ('molo.profiles:edit_my_profile', False)),
+])
+
+
+def add_security_questions(site, start, stop):
+    index = SecurityQuestionIndexPage.objects.descendant_of(
+        site.root_page).first()
+    if index is None:
+        index = SecurityQuestionIndexPage(
+            title='Security Questions', slug='security-questions-benchmark')
+        site.root_page.add_child(instance=index)
+    for i in range(start, stop):
+        index.add_child(instance=SecurityQuestion(
+            title='Benchmark question %s?' % i,
+            slug='benchmark-question-%s' % i))
+
+
+def count_objects():
+    gc.collect()
+    return len(gc.get_objects())
+
+
+def measure_render(client, url, count):
+    """
+    Queries, milliseconds, objects left alive and, where tracemalloc is
+    available (Python 3), peak kilobytes allocated per render of url. The
+    first render isn't counted, so the caches it fills are warm like they
+    are in production.
+    """
+    response = client.get(url)
+    if response.status_code != 200:
+        raise CommandError('%s returned %s' % (url, response.status_code))
+    objects = count_objects()
+    if tracemalloc is not None:
+        tracemalloc.start()
+    with CaptureQueriesContext(connection) as queries:
+        start = time.time()
+        for _ in range(count):
+            client.get(url)
+        elapsed = time.time() - start
+    peak = None
+    if tracemalloc is not None:
+        peak = tracemalloc.get_traced_memory()[1] / 1024.0
+        tracemalloc.stop()
+    # the captured queries are still alive, they're counted separately
+    objects = count_objects() - objects - len(queries.captured_queries)
+    return OrderedDict([
+        ('queries', len(queries) / float(count)),
+        ('ms', elapsed * 1000 / count),
+        ('objects', objects / float(count)),
+        ('kb', peak),
+    ])
+
+
+@benchmark
+def page_render(stdout, count=20):
+    """
+    Queries, milliseconds, objects left alive and kilobytes allocated per
+    render of each profile page for anonymous and logged in users, with
+    0, 1 and 5 security questions on the site.
+
+    PROFILES_BENCHMARK_THRESHOLDS sets the most each page may use, e.g.
+    ``{'viewprofile': {'queries': 10, 'ms': 50}}``, and the benchmark fails
+    once any of them is passed. Kilobytes can only be measured on Python
+    3, a limit on them fails straight away on Python 2.
+    """
+    thresholds = getattr(settings, 'PROFILES_BENCHMARK_THRESHOLDS', {})
+    if tracemalloc is None and any(
+            'kb' in limits for limits in thresholds.values()):
+        raise CommandError(
+            'Kilobytes allocated can only be measured on Python 3, '
+            'limit objects instead')
+    site = Site.objects.get(is_default_site=True)
+    regressions = []
+
+    def render_pages():
+        profile_settings = UserProfilesSettings.for_site(site)
+        profile_settings.show_security_question_fields = True
+        profile_settings.save()
+        user = User.objects.create_user(
+            username='benchmark-user', password='1234')
+        questions = 0
+        for total in (0, 1, 5):
+            add_security_questions(site, questions, total)
+            questions = total
+            for logged_in in (False, True):
+                client = Client()
+                if logged_in:
+                    client.force_login(user)
+                for name, (url_name, anonymous) in PAGES.items():
+                    if not (logged_in or anonymous):
+                        continue
+                    results = measure_render(client, reverse(url_name), count)
+                    label = '%s (%s, %d questions)' % (
+                        name, 'logged in' if logged_in else 'anonymous',
+                        questions)
+                    stdout.write(
+                        '%s: %.1f queries, %.2f ms, %.1f objects, %s KB' % (
+                            label, results['queries'], results['ms'],
+                            results['objects'],
+                            'n/a' if results['kb'] is None else
+                            '%d' % results['kb']))
+                    for measure, limit in thresholds.get(name, {}).items():
+                        if results.get(measure) is not None and \
+                                results[measure] > limit:
+                            regressions.append('%s: %s %.1f > %s' % (
+                                label, measure, results[measure], limit))
+
+    rolled_back(render_pages)
+
+    if regressions:
+        raise CommandError(
+            'Thresholds passed:\n%s' % '\n'.join(regressions))
@@ -0,0 +1,117 @@
+import re
+
+from django.conf import settings
+
+
+REGEX_PHONE = settings.REGEX_PHONE if hasattr(settings, 'REGEX_PHONE') else \
+    r'.*?(\(?\d{3})? ?[\.-]? ?\d{3} ?[\.-]? ?\d{4}.*?'
+
+REGEX_EMAIL = settings.REGEX_EMAIL if hasattr(settings, 'REGEX_PHONE') else \
+    r'([\w\.-]+@[\w\.-]+)'
+
+PHONE = 'phone'
+EMAIL = 'email'
+BLOCKED = 'blocked'
+
+# escaped characters, and groups that refer to other groups or set flags
+GROUP_REFERENCE = re.compile(r'\\(.)|(\(\?[(PaiLmsux])', re.DOTALL)
+
+# compiled filters, keyed by the settings they were compiled from
+_filters = {}
+
+
+def strip_wildcards(pattern):
+    """
+    Drop leading and trailing ``.*?`` from a pattern. They can't change
+    whether a search matches, but the leading one makes the search retry
+    the rest of the pattern from every position.
+    """
+    while pattern.startswith('.*?'):
+        pattern = pattern[3:]
+    while pattern.endswith('.*?') and not pattern[:-3].endswith('\\'):
+        pattern = pattern[:-3]
+    return pattern
+
+
+def refers_to_groups(pattern):
+    """
+    Whether a pattern has backreferences, named groups, conditionals or
+    inline flags. Combined with other patterns group numbers shift, names
+    can clash and flags apply to every pattern, so these are searched on
+    their own.
+    """
+    for escaped, group in GROUP_REFERENCE.findall(pattern):
+        if group or (escaped and escaped in '123456789g'):
+            return True
+    return False
+
+
+def split_lines(value):
+    return tuple(
+        line.strip() for line in (value or '').splitlines() if line.strip())
+
+
+class ContentFilter(object):
+    """
+    Rejects usernames and display names containing personal information
+    or blocked words.
+
+    All the enabled patterns are compiled once into a single alternation
+    with a named group per pattern, so checking a value is one regex
+    search and the name of the matching group tells us why it failed.
+    Blocked patterns that refer to their own groups are searched one by
+    one after it.
+    """
+
+    def __init__(self, prevent_phone=False, prevent_email=False,
+                 patterns=(), blocklist=()):
+        alternatives = []
+        if prevent_phone:
+            alternatives.append((PHONE, REGEX_PHONE))
+        if prevent_email:
+            alternatives.append((EMAIL, REGEX_EMAIL))
+        self.standalone = []
+        for index, pattern in enumerate(patterns):
+            if refers_to_groups(pattern):
+                self.standalone.append(re.compile(pattern))
+            else:
+                alternatives.append(('%s_%s' % (BLOCKED, index), pattern))
+
+        self.regex = re.compile('|'.join(
+            '(?P<%s>%s)' % (name, strip_wildcards(pattern))
+            for name, pattern in alternatives)) if alternatives else None
+        self.blocklist = re.compile('|'.join(
+            re.escape(word) for word in blocklist),
+            re.IGNORECASE | re.UNICODE) if blocklist else None
+
+    @classmethod
+    def for_settings(cls, profile_settings):
+        key = (
+            profile_settings.prevent_phone_number_in_username,
+            profile_settings.prevent_email_in_username,
+            split_lines(profile_settings.username_blocked_patterns),
+            split_lines(profile_settings.username_blocklist),
+        )
+        if key not in _filters:
+            _filters[key] = cls(*key)
+        return _filters[key]
+
+    def check(self, value):
+        """
+        Returns why the value isn't allowed, or None if it is.
+        """
+        if self.regex is not None:
+            match = self.regex.search(value)
+            if match:
+                if match.lastgroup.startswith(BLOCKED):
+                    return BLOCKED
+                return match.lastgroup
+        for regex in self.standalone:
+            if regex.search(value):
+                return BLOCKED
+        if self.blocklist is not None and self.blocklist.search(value):
+            return BLOCKED
+        return None
+
+    def is_allowed(self, value):
+        return self.check(value) is None
@@ -1,7 +1,9 @@
+from django.utils.functional import SimpleLazyObject
+
 from molo.profiles.forms import EditProfileForm
 
 
-def get_profile_data(request):
+def get_user_profile_data(request):
     username = ''
     alias = ''
     date_of_birth = ''
@@ -16,18 +18,29 @@ def get_profile_data(request):
             alias = 'Anonymous'
         date_of_birth = profile.date_of_birth
         mobile_number = profile.mobile_number
-    edit_profile_form = EditProfileForm(
-        initial={
-            'username': username,
-            'alias': alias,
-            'mobile_number': mobile_number,
-            'date_of_birth': date_of_birth
-        }
-    )
     return {
         'username': username,
         'alias': alias,
         'date_of_birth': date_of_birth,
         'mobile_number': mobile_number,
-        'edit_profile_form': edit_profile_form
+    }
+
+
+def get_profile_data(request):
+    """
+    This runs for every page, so the profile and the form are only loaded
+    once a template uses one of them.
+    """
+    data = SimpleLazyObject(lambda: get_user_profile_data(request))
+
+    def lazy_value(name):
+        return SimpleLazyObject(lambda: data[name])
+
+    return {
+        'username': lazy_value('username'),
+        'alias': lazy_value('alias'),
+        'date_of_birth': lazy_value('date_of_birth'),
+        'mobile_number': lazy_value('mobile_number'),
+        'edit_profile_form': SimpleLazyObject(
+            lambda: EditProfileForm(initial=dict(data)))
     }
@@ -0,0 +1,87 @@
+from collections import OrderedDict
+
+REGISTRATION = 'registration'
+DONE = 'done'
+EDIT = 'edit'
+
+# the settings that turn each optional profile field on, capture it when
+# registering rather than on the done page and make it required
+OPTIONAL_FIELDS = OrderedDict([
+    ('alias', (
+        'activate_display_name', 'capture_display_name_on_reg',
+        'display_name_required')),
+    ('date_of_birth', (
+        'activate_dob', 'capture_dob_on_reg', 'dob_required')),
+    ('gender', (
+        'activate_gender', 'capture_gender_on_reg', 'gender_required')),
+    ('location', (
+        'activate_location', 'capture_location_on_reg',
+        'location_required')),
+    ('education_level', (
+        'activate_education_level', 'capture_education_level_on_reg',
+        'activate_education_level_required')),
+])
+
+SETTING_NAMES = (
+    'show_mobile_number_field', 'mobile_number_required', 'country_code',
+    'show_email_field', 'email_required',
+) + tuple(name for names in OPTIONAL_FIELDS.values() for name in names)
+
+# compiled schemas, keyed by the settings they were compiled from
+_schemas = {}
+
+
+class ProfileFieldSchema(object):
+    """
+    The profile fields a site's settings put on the registration, done
+    and edit profile forms, and which of them are required.
+
+    Schemas are compiled once per combination of settings, so forms only
+    have to look their fields up rather than work them out from the
+    settings every time.
+    """
+
+    def __init__(self, values):
+        settings = dict(zip(SETTING_NAMES, values))
+        mobile_number_required = bool(
+            settings['mobile_number_required'] and
+            settings['show_mobile_number_field'] and
+            settings['country_code'])
+        email_required = bool(
+            settings['email_required'] and settings['show_email_field'])
+
+        self.fields = {
+            REGISTRATION: OrderedDict([
+                ('mobile_number', mobile_number_required),
+                ('email', email_required)]),
+            DONE: OrderedDict(),
+            EDIT: OrderedDict([
+                ('mobile_number', mobile_number_required),
+                ('email', email_required)]),
+        }
+        for name, (activate, capture_on_reg, required) in \
+                OPTIONAL_FIELDS.items():
+            if not settings[activate]:
+                continue
+            stage = REGISTRATION if settings[capture_on_reg] else DONE
+            self.fields[stage][name] = bool(settings[required])
+            self.fields[EDIT][name] = bool(settings[required])
+
+    @classmethod
+    def for_settings(cls, profile_settings):
+        key = tuple(getattr(profile_settings, name) for name in SETTING_NAMES)
+        if key not in _schemas:
+            _schemas[key] = cls(key)
+        return _schemas[key]
+
+    def apply(self, form, stage):
+        """
+        Set which of the form's profile fields are required at this stage.
+        Fields the stage doesn't use are never required.
+        """
+        for name, field in form.fields.items():
+            if name in self.fields[stage]:
+                field.required = self.fields[stage][name]
+            elif name in OPTIONAL_FIELDS or name in (
+                    'mobile_number', 'email'):
+                field.required = False
@@ -1,35 +1,37 @@
-from django.utils import timezone
-
-import re
-
 from django import forms
-from django.forms.extras.widgets import SelectDateWidget
 from django.contrib.auth import authenticate
 from django.contrib.auth import get_user_model
 from django.contrib.auth.forms import AuthenticationForm
 from django.utils.translation import ugettext_lazy as _
-from django.conf import settings
 
 from wagtail.wagtailcore.models import Site
+from molo.profiles.content_filter import (  # noqa
+    BLOCKED, REGEX_EMAIL, REGEX_PHONE, ContentFilter)
+from molo.profiles.field_schema import (
+    DONE, EDIT, REGISTRATION, ProfileFieldSchema)
 from molo.profiles.models import UserProfile, UserProfilesSettings
+from molo.profiles.throttling import Throttle
+from molo.profiles.widgets import DateOfBirthWidget
 
 from phonenumber_field.formfields import PhoneNumberField
 
 User = get_user_model()
 
-REGEX_PHONE = settings.REGEX_PHONE if hasattr(settings, 'REGEX_PHONE') else \
-    r'.*?(\(?\d{3})? ?[\.-]? ?\d{3} ?[\.-]? ?\d{4}.*?'
-
-REGEX_EMAIL = settings.REGEX_EMAIL if hasattr(settings, 'REGEX_PHONE') else \
-    r'([\w\.-]+@[\w\.-]+)'
-
 
 class MoloAuthenticationForm(AuthenticationForm):
+    error_messages = dict(AuthenticationForm.error_messages, throttled=_(
+        "Too many attempts. Please try again later."))
+
     def clean(self):
         username = self.cleaned_data.get('username')
         password = self.cleaned_data.get('password')
 
         if username and password:
+            # the request is optional for authentication forms
+            throttle = Throttle('login') if self.request else None
+            if throttle and throttle.attempt(self.request, username):
+                raise forms.ValidationError(
+                    self.error_messages['throttled'], code='throttled')
             self.user_cache = authenticate(request=self.request,
                                            username=username,
                                            password=password)
@@ -40,48 +42,79 @@ class MoloAuthenticationForm(AuthenticationForm):
                     params={'username': self.username_field.verbose_name},
                 )
             else:
+                if throttle:
+                    throttle.reset(self.request, username)
                 self.confirm_login_allowed(self.user_cache)
 
         return self.cleaned_data
 
 
-def get_validation_msg_fragment():
-    site = Site.objects.get(is_default_site=True)
-    profile_settings = UserProfilesSettings.for_site(site)
+class ProfileValidationContext(object):
+    """
+    The site and profile settings that profile forms validate against.
 
-    invalid_msg = ''
+    Forms build this once, from the request's site when they have a
+    request, and hand it to every validator so that validating a field
+    doesn't look up the site and its settings again.
+    """
 
-    if getattr(profile_settings, 'prevent_email_in_username', False) \
-            and getattr(profile_settings, 'prevent_phone_number_in_username',
-                        False):
-        invalid_msg = 'phone number or email address'
+    def __init__(self, site, profile_settings):
+        self.site = site
+        self.profile_settings = profile_settings
 
-    elif getattr(profile_settings, 'prevent_phone_number_in_username', False):
-        invalid_msg = 'phone number'
+    @classmethod
+    def for_request(cls, request=None):
+        if not request:
+            site = Site.objects.get(is_default_site=True)
+            return cls(site, UserProfilesSettings.for_site(site))
+
+        if not hasattr(request, '_profile_validation_context'):
+            request._profile_validation_context = cls(
+                request.site, UserProfilesSettings.for_request(request))
+        return request._profile_validation_context
+
+    def get_validation_msg_fragment(self):
+        prevent_email = self.profile_settings.prevent_email_in_username
+        prevent_phone = self.profile_settings.prevent_phone_number_in_username
 
-    elif getattr(profile_settings, 'prevent_email_in_username', False):
-        invalid_msg = 'email address'
+        if prevent_email and prevent_phone:
+            return 'phone number or email address'
+        elif prevent_phone:
+            return 'phone number'
+        elif prevent_email:
+            return 'email address'
+        return ''
 
-    return invalid_msg
+    @property
+    def content_filter(self):
+        return ContentFilter.for_settings(self.profile_settings)
 
+    @property
+    def field_schema(self):
+        return ProfileFieldSchema.for_settings(self.profile_settings)
 
-def validate_no_email_or_phone(input):
-    site = Site.objects.get(is_default_site=True)
-    profile_settings = UserProfilesSettings.for_site(site)
+    def validate_no_email_or_phone(self, input):
+        return self.content_filter.is_allowed(input)
 
-    regexes = []
-    if profile_settings.prevent_phone_number_in_username:
-        regexes.append(REGEX_PHONE)
+    def normalise_mobile_number(self, number):
+        """
+        Prefix local numbers with the site's country code.
+        """
+        if number and not number.startswith('+'):
+            if number.startswith('0'):
+                number = number[1:]
+            number = self.profile_settings.country_code + number
+        return number
 
-    if profile_settings.prevent_email_in_username:
-        regexes.append(REGEX_EMAIL)
 
-    for regex in regexes:
-        match = re.search(regex, input)
-        if match:
-            return False
+def get_validation_msg_fragment(context=None):
+    context = context or ProfileValidationContext.for_request()
+    return context.get_validation_msg_fragment()
 
-    return True
+
+def validate_no_email_or_phone(input, context=None):
+    context = context or ProfileValidationContext.for_request()
+    return context.validate_no_email_or_phone(input)
 
 
 class RegistrationForm(forms.Form):
@@ -123,9 +156,7 @@ class RegistrationForm(forms.Form):
         required=False
     )
     date_of_birth = forms.DateField(
-        widget=SelectDateWidget(
-            years=list(reversed(range(1930, timezone.now().year + 1)))
-        ),
+        widget=DateOfBirthWidget(),
         required=False
     )
     gender = forms.CharField(
@@ -146,38 +177,10 @@ class RegistrationForm(forms.Form):
         questions = kwargs.pop("questions", [])
         request = kwargs.pop("request", [])
         super(RegistrationForm, self).__init__(*args, **kwargs)
-        if not request:
-            site = Site.objects.get(is_default_site=True)
-            profile_settings = UserProfilesSettings.for_site(site)
-        else:
-            profile_settings = UserProfilesSettings.for_site(request.site)
-        self.fields['mobile_number'].required = (
-            profile_settings.mobile_number_required and
-            profile_settings.show_mobile_number_field and
-            profile_settings.country_code)
-        self.fields['email'].required = (
-            profile_settings.email_required and
-            profile_settings.show_email_field)
-        self.fields['alias'].required = (
-            profile_settings.activate_display_name and
-            profile_settings.capture_display_name_on_reg and
-            profile_settings.display_name_required)
-        self.fields['date_of_birth'].required = (
-            profile_settings.activate_dob and
-            profile_settings.capture_dob_on_reg and
-            profile_settings.dob_required)
-        self.fields['gender'].required = (
-            profile_settings.activate_gender and
-            profile_settings.capture_gender_on_reg and
-            profile_settings.gender_required)
-        self.fields['location'].required = (
-            profile_settings.activate_location and
-            profile_settings.capture_location_on_reg and
-            profile_settings.location_required)
-        self.fields['education_level'].required = (
-            profile_settings.activate_education_level and
-            profile_settings.capture_education_level_on_reg and
-            profile_settings.activate_education_level_required)
+        self.validation_context = ProfileValidationContext.for_request(
+            request)
+        profile_settings = self.validation_context.profile_settings
+        self.validation_context.field_schema.apply(self, REGISTRATION)
 
         # Security questions fields are created dynamically.
         # This allows any number of security questions to be specified
@@ -203,14 +206,20 @@ class RegistrationForm(forms.Form):
         ]
 
     def clean_username(self):
-        validation_msg_fragment = get_validation_msg_fragment()
+        validation_msg_fragment = get_validation_msg_fragment(
+            self.validation_context)
 
         if User.objects.filter(
                 username__iexact=self.cleaned_data['username']
         ).exists():
             raise forms.ValidationError(_("Username already exists."))
 
-        if not validate_no_email_or_phone(self.cleaned_data['username']):
+        reason = self.validation_context.content_filter.check(
+            self.cleaned_data['username'])
+        if reason == BLOCKED:
+            raise forms.ValidationError(
+                _("Sorry, but that username is not allowed."))
+        elif reason:
             raise forms.ValidationError(
                 _(
                     "Sorry, but that is an invalid username. Please don't use"
@@ -223,25 +232,24 @@ class RegistrationForm(forms.Form):
     def is_valid(self):
         if 'mobile_number' in self.data:
             if not self.data['mobile_number'].startswith('+'):
-                site = Site.objects.get(is_default_site=True)
-                profile_settings = UserProfilesSettings.for_site(site)
-                number = self.data['mobile_number']
-                if number:
-                    if number.startswith('0'):
-                        number = number[1:]
-                    number = profile_settings.country_code + \
-                        number
                 self.data = self.data.copy()
-                self.data['mobile_number'] = number
+                self.data['mobile_number'] = \
+                    self.validation_context.normalise_mobile_number(
+                        self.data['mobile_number'])
         valid = super(RegistrationForm, self).is_valid()
         return valid
 
     def clean_alias(self):
-        validation_msg_fragment = get_validation_msg_fragment()
+        validation_msg_fragment = get_validation_msg_fragment(
+            self.validation_context)
 
         alias = self.cleaned_data['alias']
 
-        if not validate_no_email_or_phone(alias):
+        reason = self.validation_context.content_filter.check(alias)
+        if reason == BLOCKED:
+            raise forms.ValidationError(
+                _("Sorry, but that display name is not allowed."))
+        elif reason:
             raise forms.ValidationError(
                 _(
                     "Sorry, but that is an invalid display name. "
@@ -255,9 +263,7 @@ class RegistrationForm(forms.Form):
 
 class DoneForm(forms.Form):
     date_of_birth = forms.DateField(
-        widget=SelectDateWidget(
-            years=list(reversed(range(1930, timezone.now().year + 1)))
-        )
+        widget=DateOfBirthWidget()
     )
     alias = forms.CharField(
         label=_("Display Name"),
@@ -279,31 +285,9 @@ class DoneForm(forms.Form):
     def __init__(self, *args, **kwargs):
         request = kwargs.pop("request", [])
         super(DoneForm, self).__init__(*args, **kwargs)
-        if not request:
-            site = Site.objects.get(is_default_site=True)
-            profile_settings = UserProfilesSettings.for_site(site)
-        else:
-            profile_settings = UserProfilesSettings.for_site(request.site)
-        self.fields['date_of_birth'].required = (
-            profile_settings.activate_dob and not
-            profile_settings.capture_dob_on_reg and
-            profile_settings.dob_required)
-        self.fields['alias'].required = (
-            profile_settings.activate_display_name and not
-            profile_settings.capture_display_name_on_reg and
-            profile_settings.display_name_required)
-        self.fields['gender'].required = (
-            profile_settings.activate_gender and not
-            profile_settings.capture_gender_on_reg and
-            profile_settings.gender_required)
-        self.fields['location'].required = (
-            profile_settings.activate_location and not
-            profile_settings.capture_location_on_reg and
-            profile_settings.location_required)
-        self.fields['education_level'].required = (
-            profile_settings.activate_education_level and not
-            profile_settings.capture_education_level_on_reg and
-            profile_settings.activate_education_level_required)
+        self.validation_context = ProfileValidationContext.for_request(
+            request)
+        self.validation_context.field_schema.apply(self, DONE)
 
 
 class EditProfileForm(forms.ModelForm):
@@ -312,9 +296,7 @@ class EditProfileForm(forms.ModelForm):
         required=False
     )
     date_of_birth = forms.DateField(
-        widget=SelectDateWidget(
-            years=list(reversed(range(1930, timezone.now().year + 1)))
-        ),
+        widget=DateOfBirthWidget(),
         required=False
     )
     gender = forms.CharField(
@@ -335,33 +317,9 @@ class EditProfileForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         request = kwargs.pop("request", [])
         super(EditProfileForm, self).__init__(*args, **kwargs)
-        if not request:
-            site = Site.objects.get(is_default_site=True)
-            profile_settings = UserProfilesSettings.for_site(site)
-        else:
-            profile_settings = UserProfilesSettings.for_site(request.site)
-        self.fields['mobile_number'].required = (
-            profile_settings.mobile_number_required and
-            profile_settings.show_mobile_number_field and
-            profile_settings.country_code)
-        self.fields['email'].required = (
-            profile_settings.email_required and
-            profile_settings.show_email_field)
-        self.fields['alias'].required = (
-            profile_settings.activate_display_name and
-            profile_settings.display_name_required)
-        self.fields['date_of_birth'].required = (
-            profile_settings.activate_dob and
-            profile_settings.dob_required)
-        self.fields['gender'].required = (
-            profile_settings.activate_gender and
-            profile_settings.gender_required)
-        self.fields['location'].required = (
-            profile_settings.activate_location and
-            profile_settings.location_required)
-        self.fields['education_level'].required = (
-            profile_settings.activate_education_level and
-            profile_settings.activate_education_level_required)
+        self.validation_context = ProfileValidationContext.for_request(
+            request)
+        self.validation_context.field_schema.apply(self, EDIT)
 
     class Meta:
         model = UserProfile
@@ -369,11 +327,16 @@ class EditProfileForm(forms.ModelForm):
                   'gender', 'location', 'education_level']
 
     def clean_alias(self):
-        validation_msg_fragment = get_validation_msg_fragment()
+        validation_msg_fragment = get_validation_msg_fragment(
+            self.validation_context)
 
         alias = self.cleaned_data['alias']
 
-        if not validate_no_email_or_phone(alias):
+        reason = self.validation_context.content_filter.check(alias)
+        if reason == BLOCKED:
+            raise forms.ValidationError(
+                _("Sorry, but that display name is not allowed."))
+        elif reason:
             raise forms.ValidationError(
                 _(
                     "Sorry, but that is an invalid display name. "
@@ -387,16 +350,10 @@ class EditProfileForm(forms.ModelForm):
     def is_valid(self):
         if 'mobile_number' in self.data:
             if not self.data['mobile_number'].startswith('+'):
-                site = Site.objects.get(is_default_site=True)
-                profile_settings = UserProfilesSettings.for_site(site)
-                number = self.data['mobile_number']
-                if number:
-                    if number.startswith('0'):
-                        number = number[1:]
-                    number = profile_settings.country_code + \
-                        number
                 self.data = self.data.copy()
-                self.data['mobile_number'] = number
+                self.data['mobile_number'] = \
+                    self.validation_context.normalise_mobile_number(
+                        self.data['mobile_number'])
         valid = super(EditProfileForm, self).is_valid()
         return valid
 
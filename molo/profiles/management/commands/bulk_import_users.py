@@ -0,0 +1,32 @@
+import os
+
+import tablib
+from django.core.management.base import BaseCommand
+
+from molo.profiles.admin import MultiSiteUserResource
+
+
+class Command(BaseCommand):
+    help = 'Imports users exported from another Molo site in bulk.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', type=str)
+        parser.add_argument(
+            '--format', type=str, default=None,
+            help='The format of the file, defaults to its extension.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or \
+            os.path.splitext(path)[1].lstrip('.')
+        with open(path, 'rb') as f:
+            dataset = tablib.Dataset().load(f.read(), format=file_format)
+
+        def progress(processed, imported, total):
+            self.stdout.write('%s/%s rows processed, %s users imported' % (
+                processed, total, imported))
+
+        imported = MultiSiteUserResource().bulk_import(
+            dataset, batch_size=options['batch_size'], progress=progress)
+        self.stdout.write('Imported %s users' % imported)
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from molo.profiles.benchmarks import BENCHMARKS
+
+
+class Command(BaseCommand):
+    help = 'Runs one of the molo.profiles benchmarks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', type=str, choices=list(BENCHMARKS))
+        parser.add_argument(
+            '--count', type=int, default=None,
+            help='The size of the benchmark, e.g. the number of rows.')
+
+    def handle(self, *args, **options):
+        kwargs = {}
+        if options.get('count') is not None:
+            kwargs['count'] = options['count']
+        BENCHMARKS[options['name']](self.stdout, **kwargs)
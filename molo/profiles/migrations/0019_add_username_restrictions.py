@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 00:35
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0018_userprofile_admin_sites'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofilessettings',
+            name='username_blocked_patterns',
+            field=models.TextField(blank=True, default=b'', help_text='Regular expressions that usernames and display names may not match, one per line', verbose_name='Blocked username / display name patterns'),
+        ),
+        migrations.AddField(
+            model_name='userprofilessettings',
+            name='username_blocklist',
+            field=models.TextField(blank=True, default=b'', help_text='Words that usernames and display names may not contain, one per line', verbose_name='Blocked username / display name words'),
+        ),
+    ]
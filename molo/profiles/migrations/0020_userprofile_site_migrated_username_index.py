@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 01:28
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0019_add_username_restrictions'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='userprofile',
+            index_together=set([('site', 'migrated_username')]),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+INDEXES = (
+    ('profiles_auth_user_date_joined', 'date_joined'),
+    ('profiles_auth_user_last_login', 'last_login'),
+)
+
+
+def get_index_names(schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        return set(connection.introspection.get_constraints(
+            cursor, 'auth_user'))
+
+
+def create_indexes(apps, schema_editor):
+    # IF NOT EXISTS isn't supported by every database, so the indexes
+    # that already exist are looked up instead
+    existing = get_index_names(schema_editor)
+    for name, column in INDEXES:
+        if name not in existing:
+            schema_editor.execute(schema_editor.sql_create_index % {
+                'name': schema_editor.quote_name(name),
+                'table': schema_editor.quote_name('auth_user'),
+                'columns': schema_editor.quote_name(column),
+                'extra': '',
+            })
+
+
+def drop_indexes(apps, schema_editor):
+    existing = get_index_names(schema_editor)
+    for name, column in INDEXES:
+        if name in existing:
+            schema_editor.execute(schema_editor.sql_delete_index % {
+                'name': schema_editor.quote_name(name),
+                'table': schema_editor.quote_name('auth_user'),
+            })
+
+
+class Migration(migrations.Migration):
+    """
+    Index auth_user's date_joined and last_login, which the daily user
+    stats and the frontend users admin filter on. auth.User belongs to
+    django.contrib.auth, so the indexes are created here, with each
+    database's own index statements.
+    """
+
+    dependencies = [
+        ('auth', '0007_alter_validators_add_error_messages'),
+        ('profiles', '0020_userprofile_site_migrated_username_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
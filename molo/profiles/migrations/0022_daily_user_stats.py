@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 02:26
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtailcore', '0032_add_bulk_delete_page_permission'),
+        ('profiles', '0021_auth_user_date_joined_last_login_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyUserStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('total_users', models.PositiveIntegerField(default=0)),
+                ('new_users', models.PositiveIntegerField(default=0)),
+                ('returning_users', models.PositiveIntegerField(default=0)),
+                ('active_users', models.PositiveIntegerField(default=0)),
+                ('site', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='wagtailcore.Site')),
+            ],
+            options={
+                'ordering': ['-date'],
+                'verbose_name_plural': 'daily user stats',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyUserStatsBreakdown',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(max_length=32)),
+                ('value', models.CharField(blank=True, max_length=128)),
+                ('users', models.PositiveIntegerField(default=0)),
+                ('stats', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='breakdowns', to='profiles.DailyUserStats')),
+            ],
+            options={
+                'ordering': ['field', 'value'],
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailyuserstats',
+            unique_together=set([('site', 'date')]),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 02:41
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from molo.profiles.search import get_search_terms
+
+
+def index_search_terms(apps, schema_editor):
+    UserProfile = apps.get_model('profiles', 'UserProfile')
+    UserSearchTerm = apps.get_model('profiles', 'UserSearchTerm')
+    profiles = UserProfile.objects.order_by('pk').values_list(
+        'pk', 'user__username', 'migrated_username', 'alias',
+        'mobile_number')
+    last_pk = None
+    while True:
+        chunk = profiles
+        if last_pk is not None:
+            chunk = chunk.filter(pk__gt=last_pk)
+        chunk = list(chunk[:2000])
+        if not chunk:
+            return
+        UserSearchTerm.objects.bulk_create([
+            UserSearchTerm(profile_id=row[0], term=term)
+            for row in chunk for term in sorted(get_search_terms(*row[1:]))])
+        last_pk = chunk[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0022_daily_user_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSearchTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(db_index=True, max_length=128)),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='profiles.UserProfile')),
+            ],
+        ),
+        migrations.RunPython(
+            index_search_terms, migrations.RunPython.noop),
+    ]
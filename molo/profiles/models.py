@@ -1,15 +1,29 @@
-from django.contrib.auth import hashers
+import hashlib
+import re
+import uuid
+from collections import namedtuple
+
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.core import validators
-from django.db import models
-from django.db.models.signals import post_save
+from django.core.exceptions import ValidationError
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.encoding import force_bytes
 from django.utils.translation import ugettext_lazy as _
 
 
 from molo.core.models import (
     TranslatablePageMixin, PreventDeleteMixin, Main, index_pages_after_copy)
+from molo.core.templatetags.core_tags import get_pages
 from molo.core.utils import generate_slug
+from molo.profiles import answer_hashers, search
+from molo.profiles.content_filter import ContentFilter, split_lines
+from molo.profiles.utils import cache_on_commit, delete_on_commit
 from phonenumber_field.modelfields import PhoneNumberField
 from wagtail.wagtailcore.models import Page, Site
 from wagtail.contrib.settings.models import BaseSetting, register_setting
@@ -60,6 +74,21 @@ class UserProfilesSettings(BaseSetting):
         verbose_name=_("Prevent email in username / display name"),
     )
 
+    username_blocked_patterns = models.TextField(
+        blank=True,
+        default='',
+        verbose_name=_("Blocked username / display name patterns"),
+        help_text=_("Regular expressions that usernames and display names "
+                    "may not match, one per line"),
+    )
+    username_blocklist = models.TextField(
+        blank=True,
+        default='',
+        verbose_name=_("Blocked username / display name words"),
+        help_text=_("Words that usernames and display names may not "
+                    "contain, one per line"),
+    )
+
     show_security_question_fields = models.BooleanField(
         default=False,
         editable=True,
@@ -196,6 +225,12 @@ class UserProfilesSettings(BaseSetting):
                 FieldPanel('prevent_email_in_username'),
             ],
             heading="Email Settings", ),
+        MultiFieldPanel(
+            [
+                FieldPanel('username_blocked_patterns'),
+                FieldPanel('username_blocklist'),
+            ],
+            heading="Username / Display Name Restrictions", ),
         MultiFieldPanel(
             [
                 FieldPanel("show_security_question_fields"),
@@ -248,17 +283,146 @@ class UserProfilesSettings(BaseSetting):
     # TODO: mobile_number_required field shouldn't be shown
     # if show_mobile_number_field is False
 
+    def clean(self):
+        patterns = split_lines(self.username_blocked_patterns)
+        for pattern in patterns:
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                raise ValidationError({
+                    'username_blocked_patterns': _(
+                        'Invalid pattern "%(pattern)s": %(error)s') % {
+                            'pattern': pattern, 'error': e}})
+        # the patterns are searched together, check they still compile
+        try:
+            ContentFilter(
+                self.prevent_phone_number_in_username,
+                self.prevent_email_in_username, patterns)
+        except re.error as e:
+            raise ValidationError({
+                'username_blocked_patterns': _(
+                    'These patterns can\'t be used together: %(error)s') % {
+                        'error': e}})
+
+    @classmethod
+    def cache_key(cls, site_id):
+        return 'molo.profiles.UserProfilesSettings.%s' % site_id
+
+    @classmethod
+    def for_site(cls, site):
+        """
+        Get the settings for the site from the cache, only falling back
+        to the database when they aren't cached yet. Settings read in a
+        transaction are only cached once it commits.
+        """
+        key = cls.cache_key(site.pk)
+        field_names = [f.attname for f in cls._meta.concrete_fields]
+        cached = cache.get(key)
+        if cached is not None:
+            db, values = cached
+            return cls.from_db(db, field_names, values)
+
+        instance = super(UserProfilesSettings, cls).for_site(site)
+        # only the raw field values are cached, the instance itself would
+        # drag the site and its page tree along with it
+        cache_on_commit(key, (
+            instance._state.db,
+            [getattr(instance, name) for name in field_names]),
+            getattr(settings, 'PROFILES_SETTINGS_CACHE_TIMEOUT', 3600))
+        return instance
+
+    @classmethod
+    def for_request(cls, request):
+        """
+        Get the settings for the request's site, resolving them at most
+        once per request.
+        """
+        if not hasattr(request, '_profile_settings'):
+            request._profile_settings = cls.for_site(request.site)
+        return request._profile_settings
+
+
+@receiver(post_save, sender=UserProfilesSettings)
+@receiver(post_delete, sender=UserProfilesSettings)
+def invalidate_profile_settings(sender, instance, **kwargs):
+    delete_on_commit(UserProfilesSettings.cache_key(instance.site_id))
+
+
+@receiver(post_save, sender=Site)
+@receiver(post_delete, sender=Site)
+def invalidate_site_profile_settings(sender, instance, **kwargs):
+    # site ids can be reused, don't hand out a deleted site's settings
+    delete_on_commit(UserProfilesSettings.cache_key(instance.pk))
+    SecurityQuestion.invalidate_catalog()
+
+
+class CatalogQuestion(namedtuple('CatalogQuestion', ['pk', 'title'])):
+    """
+    A security question as the registration and forgot password forms
+    need it, the main language question's id and the translated title.
+    """
+
+    def __str__(self):
+        return self.title
+
 
 class SecurityQuestion(TranslatablePageMixin, Page):
     parent_page_types = ['SecurityQuestionIndexPage']
     subpage_types = []
 
+    CATALOG_VERSION_KEY = 'molo.profiles.SecurityQuestion.catalog_version'
+
     class Meta:
         verbose_name = _("Security Question")
 
     def __str__(self):
         return self.title
 
+    @classmethod
+    def catalog_cache_key(cls, site_id, locale):
+        version = cache.get(cls.CATALOG_VERSION_KEY)
+        if version is None:
+            version = cls.new_catalog_version()
+        return 'molo.profiles.SecurityQuestion.catalog.%s.%s.%s' % (
+            version, site_id, locale)
+
+    @classmethod
+    def new_catalog_version(cls):
+        version = uuid.uuid4().hex
+        cache.set(cls.CATALOG_VERSION_KEY, version, None)
+        return version
+
+    @classmethod
+    def invalidate_catalog(cls):
+        """
+        Drop the cached catalogs of every site and language, straight away
+        and again once the change that made them stale has committed.
+        """
+        cls.new_catalog_version()
+        transaction.on_commit(cls.new_catalog_version)
+
+    @classmethod
+    def catalog_for_request(cls, request):
+        """
+        The live security questions of the request's site in the request's
+        language, cached until a security question changes. Catalogs read
+        in a transaction are only cached once it commits.
+        """
+        key = cls.catalog_cache_key(request.site.pk, request.LANGUAGE_CODE)
+        catalog = cache.get(key)
+        if catalog is None:
+            questions = cls.objects.descendant_of(
+                request.site.root_page).live().filter(
+                languages__language__is_main_language=True)
+            catalog = [
+                CatalogQuestion(
+                    question.get_main_language_page().pk, question.title)
+                for question in get_pages(
+                    {'request': request}, questions, request.LANGUAGE_CODE)]
+            cache_on_commit(key, catalog, getattr(
+                settings, 'PROFILES_SECURITY_QUESTION_CACHE_TIMEOUT', 3600))
+        return catalog
+
 
 SecurityQuestion.content_panels = [
     FieldPanel("title", classname="full title")
@@ -267,6 +431,13 @@ SecurityQuestion.promote_panels = []
 SecurityQuestion.settings_panels = []
 
 
+# saving covers publishing and unpublishing
+@receiver(post_save, sender=SecurityQuestion)
+@receiver(post_delete, sender=SecurityQuestion)
+def invalidate_security_question_catalog(sender, instance, **kwargs):
+    SecurityQuestion.invalidate_catalog()
+
+
 class SecurityQuestionIndexPage(Page, PreventDeleteMixin):
     parent_page_types = ['core.Main']
     subpage_types = ["SecurityQuestion"]
@@ -294,6 +465,10 @@ def create_security_question_index_page(sender, instance, **kwargs):
         security_index.save_revision().publish()
 
 
+# the profile fields users are found by in the admin, with the username
+SEARCH_TERM_FIELDS = ('migrated_username', 'alias', 'mobile_number')
+
+
 class UserProfile(models.Model):
     user = models.OneToOneField(User, related_name="profile", primary_key=True)
     date_of_birth = models.DateField(null=True)
@@ -347,10 +522,127 @@ class UserProfile(models.Model):
         FieldPanel('admin_sites',),
     ]
 
+    class Meta:
+        # migrated users log in with their migrated username on their site
+        index_together = [('site', 'migrated_username')]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(UserProfile, cls).from_db(db, field_names, values)
+        # remembered so saves that don't change them don't reindex them
+        instance._indexed_search_values = instance.get_search_values()
+        return instance
+
+    def get_search_values(self):
+        return tuple(
+            self.__dict__.get(name) for name in SEARCH_TERM_FIELDS)
+
+
+def absent_username_key(site_id, username):
+    return 'molo.profiles.absent_username.%s.%s' % (
+        site_id, hashlib.md5(force_bytes(username)).hexdigest())
+
+
+def forget_absent_usernames(site_id, usernames):
+    """
+    Let the login backend look these usernames up again on the site.
+    """
+    cache.delete_many([
+        absent_username_key(site_id, username)
+        for username in usernames if username])
+
+
+@receiver(post_save, sender=UserProfile)
+def forget_absent_profile_usernames(sender, instance, **kwargs):
+    forget_absent_usernames(instance.site_id, [
+        instance.user.username, instance.migrated_username])
+
 
 @receiver(post_save, sender=User)
-def user_profile_handler(sender, instance, created, **kwargs):
+def forget_absent_user_username(sender, instance, created, update_fields,
+                                **kwargs):
+    # new users are handled once their profile is saved
+    if created or (update_fields and 'username' not in update_fields):
+        return
+    for site_id in UserProfile.objects.filter(
+            user=instance).values_list('site_id', flat=True):
+        forget_absent_usernames(site_id, [instance.username])
+
+
+class UserSearchTerm(models.Model):
+    """
+    A normalised term the admin finds a user's profile by, see
+    molo.profiles.search.
+    """
+    profile = models.ForeignKey(UserProfile, related_name='search_terms')
+    term = models.CharField(max_length=search.TERM_LENGTH, db_index=True)
+
+
+def index_search_terms(profiles, created=False):
+    """
+    Replace the search terms of the given (profile, username) pairs, or
+    just add them for newly created profiles, which have none yet.
+    """
+    profiles = list(profiles)
+    terms = [
+        UserSearchTerm(profile_id=profile.pk, term=term)
+        for profile, username in profiles
+        for term in sorted(search.get_search_terms(
+            username, profile.migrated_username, profile.alias,
+            profile.mobile_number))]
     if created:
+        UserSearchTerm.objects.bulk_create(terms)
+        return
+    with transaction.atomic():
+        UserSearchTerm.objects.filter(
+            profile_id__in=[profile.pk for profile, _username in profiles]
+        ).delete()
+        UserSearchTerm.objects.bulk_create(terms)
+
+
+def filter_by_search_terms(queryset, search_term, country_code=None):
+    """
+    Filter users or profiles down to the ones with a term starting with
+    each word of the search.
+    """
+    for prefixes in search.get_query_terms(search_term, country_code):
+        query = models.Q()
+        for prefix in prefixes:
+            query |= models.Q(term__startswith=prefix)
+        queryset = queryset.filter(pk__in=UserSearchTerm.objects.filter(
+            query).values('profile_id'))
+    return queryset
+
+
+@receiver(post_save, sender=UserProfile)
+def index_profile_search_terms(sender, instance, created, update_fields,
+                               **kwargs):
+    # the username is indexed when the user is saved
+    if update_fields and not set(SEARCH_TERM_FIELDS) & set(update_fields):
+        return
+    values = instance.get_search_values()
+    if not created and \
+            values == getattr(instance, '_indexed_search_values', None):
+        return
+    index_search_terms([(instance, instance.user.username)], created)
+    instance._indexed_search_values = values
+
+
+@receiver(post_save, sender=User)
+def index_user_search_terms(sender, instance, created, update_fields,
+                            **kwargs):
+    # new users are indexed once their profile is saved
+    if created or (update_fields and 'username' not in update_fields):
+        return
+    index_search_terms(
+        (profile, instance.username)
+        for profile in UserProfile.objects.filter(user=instance))
+
+
+@receiver(post_save, sender=User)
+def user_profile_handler(sender, instance, created, **kwargs):
+    # register_user creates the profile itself with all its fields set
+    if created and not getattr(instance, 'creating_profile', False):
         profile = UserProfile(user=instance)
         profile.site = Site.objects.get(is_default_site=True)
         profile.save()
@@ -362,21 +654,98 @@ class SecurityAnswer(models.Model):
     answer = models.CharField(max_length=150, null=False, blank=False)
 
     def set_answer(self, raw_answer):
-        self.answer = hashers.make_password(raw_answer.strip().lower())
+        self.answer = answer_hashers.make_answer(raw_answer)
 
     def check_answer(self, raw_answer):
         def setter(raw_answer):
             self.set_answer(raw_answer)
             self.save(update_fields=["answer"])
 
-        return hashers.check_password(
-            raw_answer.strip().lower(),
-            self.answer,
-            setter
-        )
+        return answer_hashers.check_answer(raw_answer, self.answer, setter)
 
     def save(self, is_import=False, *args, **kwargs):
         # checks if this save is coming from an import so we don't hash a hash
         if not is_import and not self.id:
             self.set_answer(self.answer)
         super(SecurityAnswer, self).save(*args, **kwargs)
+
+
+def register_user(site, username, password, email='', security_answers=(),
+                  **profile_fields):
+    """
+    Create a user registering on the site along with their profile and
+    the answers to their security questions, given as (question id,
+    answer) pairs.
+
+    The user, the profile and the answers are each inserted once, in a
+    single transaction.
+    """
+    with transaction.atomic():
+        user = User(
+            username=username, email=User.objects.normalize_email(email))
+        user.set_password(password)
+        user.creating_profile = True
+        user.save()
+        user.profile = UserProfile.objects.create(
+            user=user, site=site, **profile_fields)
+
+        security_answers = [
+            (question_id, answer)
+            for question_id, answer in security_answers if answer]
+        SecurityAnswer.objects.bulk_create([
+            SecurityAnswer(user_id=user.pk, question_id=question_id,
+                           answer=hashed)
+            for (question_id, _answer), hashed in zip(
+                security_answers, answer_hashers.make_answers(
+                    answer for _question_id, answer in security_answers))])
+    return user
+
+
+class DailyUserStats(models.Model):
+    """
+    A site's users on a day, rolled up by update_daily_user_stats so the
+    counts don't have to be worked out from all the users every time.
+
+    Active users logged in on the day and returning users are the active
+    users that joined before it.
+    """
+    site = models.ForeignKey(Site, blank=True, null=True, related_name='+')
+    date = models.DateField()
+    total_users = models.PositiveIntegerField(default=0)
+    new_users = models.PositiveIntegerField(default=0)
+    returning_users = models.PositiveIntegerField(default=0)
+    active_users = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = [('site', 'date')]
+        ordering = ['-date']
+        verbose_name_plural = 'daily user stats'
+
+    def __str__(self):
+        return '%s %s' % (self.site, self.date)
+
+
+@receiver(pre_delete, sender=User)
+def uncount_deleted_user(sender, instance, **kwargs):
+    # the rolled up totals carry on from day to day, take the user off
+    # every day since they joined
+    site_id = UserProfile.objects.filter(
+        user_id=instance.pk).values_list('site_id', flat=True).first()
+    DailyUserStats.objects.filter(
+        site_id=site_id, total_users__gt=0,
+        date__gte=timezone.localtime(instance.date_joined).date()).update(
+        total_users=F('total_users') - 1)
+
+
+class DailyUserStatsBreakdown(models.Model):
+    """
+    The users that joined or were active on the day with one value of a
+    profile field, or in one age group.
+    """
+    stats = models.ForeignKey(DailyUserStats, related_name='breakdowns')
+    field = models.CharField(max_length=32)
+    value = models.CharField(max_length=128, blank=True)
+    users = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['field', 'value']
@@ -0,0 +1,96 @@
+"""
+Where the daily user data is sent. Notifiers are configured as a dotted
+path and keyword arguments, so they can be passed to Celery tasks::
+
+  PROFILES_USER_DATA_NOTIFIERS = [
+      ('molo.profiles.notifiers.SlackNotifier', {'url': '...'}),
+      ('molo.profiles.notifiers.FileNotifier', {'path': '/var/log/...'}),
+  ]
+"""
+import io
+
+import requests
+from django.conf import settings
+from django.utils.encoding import force_text
+from django.utils.module_loading import import_string
+
+# (connect, read) seconds
+DEFAULT_TIMEOUT = (3.05, 10)
+
+# shared by the notifiers so connections to the same host are reused
+_session = None
+
+
+def get_session():
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        _session.headers.update({
+            'Content-Type': 'application/json',
+            'Accept': 'application/json',
+        })
+    return _session
+
+
+def get_notifier_configs():
+    """
+    The configured notifiers, or a Slack notifier for
+    SLACK_INCOMING_WEBHOOK_URL if it's set.
+    """
+    configs = getattr(settings, 'PROFILES_USER_DATA_NOTIFIERS', None)
+    if configs is not None:
+        return [(path, dict(kwargs)) for path, kwargs in configs]
+    url = getattr(settings, 'SLACK_INCOMING_WEBHOOK_URL', None)
+    if url:
+        return [('molo.profiles.notifiers.SlackNotifier', {'url': url})]
+    return []
+
+
+def get_notifier(path, kwargs):
+    return import_string(path)(**kwargs)
+
+
+class Notifier(object):
+
+    def send(self, text):
+        raise NotImplementedError
+
+
+class WebhookNotifier(Notifier):
+    """
+    Posts the text as JSON to a URL, in the given field. Connection errors,
+    timeouts and error responses raise a requests.RequestException.
+    """
+
+    def __init__(self, url, field='text', timeout=None):
+        self.url = url
+        self.field = field
+        self.timeout = tuple(timeout or getattr(
+            settings, 'PROFILES_NOTIFIER_TIMEOUT', DEFAULT_TIMEOUT))
+
+    def send(self, text):
+        response = get_session().post(
+            self.url, json={self.field: text}, timeout=self.timeout)
+        response.raise_for_status()
+
+
+class SlackNotifier(WebhookNotifier):
+    """
+    Posts the text to a Slack incoming webhook.
+    """
+
+    def __init__(self, url, timeout=None):
+        super(SlackNotifier, self).__init__(url, timeout=timeout)
+
+
+class FileNotifier(Notifier):
+    """
+    Appends the text to a local file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, text):
+        with io.open(self.path, 'a', encoding='utf-8') as f:
+            f.write(u'%s\n' % force_text(text))
@@ -1,69 +1,385 @@
+import gzip
+import os
 import requests
-from datetime import datetime, timedelta
+import tempfile
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, time, timedelta
+from tempfile import SpooledTemporaryFile
 from django.contrib.auth.models import User
 from django.conf import settings
 from celery import task
+from django.core import signing
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.core.urlresolvers import reverse
 from django.core.mail import EmailMultiAlternatives
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Max, Q, Sum, When
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from wagtail.wagtailcore.models import Site
+from molo.profiles import notifiers
 from molo.profiles.admin_import_export import FrontendUsersResource
+from molo.profiles.models import DailyUserStats, DailyUserStatsBreakdown
+
+# exports are kept in memory up to this size before spilling to disk
+EXPORT_SPOOL_SIZE = 5 * 1024 * 1024
+EXPORT_TOKEN_SALT = 'molo.profiles.export'
+
+
+def get_user_stats(now=None):
+    """
+    The total, new and returning users of each site, counted in a single
+    pass over the users.
+
+    New users joined in the 24 hours before now, returning users joined
+    before that and logged in since.
+    """
+    since = (now or timezone.now()) - timedelta(hours=24)
+    return list(User.objects.values('profile__site').annotate(
+        total=Count('pk'),
+        new=Sum(Case(
+            When(date_joined__gte=since, then=1),
+            default=0, output_field=IntegerField())),
+        returning=Sum(Case(
+            When(date_joined__lt=since, last_login__gte=since, then=1),
+            default=0, output_field=IntegerField())),
+    ).order_by('profile__site'))
+
+
+def get_user_totals(stats):
+    return dict(
+        (key, sum(row[key] for row in stats))
+        for key in ('total', 'new', 'returning'))
 
 
 def get_count_of_new_users():
-    now = datetime.now()
-    qs = User.objects.filter(date_joined__gte=now - timedelta(hours=24))
-    return qs.count()
+    return get_user_totals(get_user_stats())['new']
 
 
 def get_count_of_returning_users():
-    now = datetime.now()
-    qs = User.objects.filter(last_login__gte=now - timedelta(hours=24)).filter(
-        date_joined__lt=now - timedelta(hours=24))
-    return qs.count()
+    return get_user_totals(get_user_stats())['returning']
 
 
 def get_count_of_all_users():
-    qs = User.objects.all()
-    return qs.count()
+    return get_user_totals(get_user_stats())['total']
 
 
-def get_message_text():
-    return ("DAILY UPDATE ON USER DATA\n"
-            "New User - joined in the last 24 hours\n"
-            "Returning User - joined longer than 24 hours ago"
-            "and visited the site in the last 24 hours\n"
+def get_message_text(stats=None, day=None):
+    """
+    The message for the users of the last 24 hours, or for the stats
+    rolled up for the day.
+    """
+    if stats is None:
+        stats = get_user_stats()
+    totals = get_user_totals(stats)
+    if day is None:
+        header = ("New User - joined in the last 24 hours\n"
+                  "Returning User - joined longer than 24 hours ago"
+                  "and visited the site in the last 24 hours\n")
+    else:
+        header = ("New User - joined on {0}\n"
+                  "Returning User - joined before {0} "
+                  "and visited the site on {0}\n".format(day.isoformat()))
+    text = ("DAILY UPDATE ON USER DATA\n" + header +
             "```"
             "Total Users: {0}\n"
             "New Users: {1}\n"
             "Returning Users: {2}"
             "```"
-            .format(get_count_of_all_users(),
-                    get_count_of_new_users(),
-                    get_count_of_returning_users()))
+            .format(totals['total'], totals['new'], totals['returning']))
+    if len(stats) > 1:
+        sites = Site.objects.in_bulk(
+            [row['profile__site'] for row in stats])
+        text += "\n```%s```" % "\n".join(
+            "{0}: {1} total, {2} new, {3} returning".format(
+                sites[row['profile__site']]
+                if row['profile__site'] in sites else 'No site',
+                row['total'], row['new'], row['returning'])
+            for row in stats)
+    return text
+
+
+# the lowest age in each age group of the daily user stats
+AGE_GROUPS = ((35, '35+'), (25, '25-34'), (18, '18-24'), (13, '13-17'),
+              (0, '0-12'))
+BREAKDOWN_FIELDS = ('gender', 'location', 'education_level')
+
+
+def get_age_group(date_of_birth, day):
+    if date_of_birth is None:
+        return ''
+    age = day.year - date_of_birth.year - (
+        (day.month, day.day) < (date_of_birth.month, date_of_birth.day))
+    for lowest, group in AGE_GROUPS:
+        if age >= lowest:
+            return group
+    return ''
+
+
+def get_day_window(day):
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, timezone.make_aware(
+        datetime.combine(day + timedelta(days=1), time.min))
+
+
+def count_users_joined_before(moment):
+    """
+    Each site's users that joined before the moment. This reads nearly
+    every user, so it's only done when there are no totals to carry on
+    from, or to reconcile them.
+    """
+    return dict(User.objects.filter(
+        date_joined__lt=moment).values('profile__site').annotate(
+        total=Count('pk')).values_list('profile__site', 'total'))
+
+
+def rollup_daily_user_stats(day, totals=None):
+    """
+    Roll up the users of each site on the day. Only the users that joined
+    or logged in on the day are read. The totals carry on from the given
+    totals of the day before, or from its rolled up stats, and are only
+    counted from all the users when there are neither. Rolling a day up
+    again replaces its stats. Returns the totals at the end of the day.
+
+    Deleted users are taken off the rolled up totals when they're deleted,
+    users imported with an earlier date_joined are only counted once
+    recount_daily_user_totals runs.
+    """
+    start, end = get_day_window(day)
+    rows = User.objects.filter(
+        Q(date_joined__gte=start, date_joined__lt=end) |
+        Q(last_login__gte=start, last_login__lt=end)).values_list(
+        'profile__site', 'date_joined', 'last_login',
+        'profile__date_of_birth',
+        *['profile__%s' % field for field in BREAKDOWN_FIELDS])
+
+    stats = defaultdict(Counter)
+    breakdowns = defaultdict(Counter)
+    for row in rows:
+        site_id, date_joined, last_login, date_of_birth = row[:4]
+        new = start <= date_joined < end
+        active = last_login is not None and start <= last_login < end
+        stats[site_id].update({
+            'new_users': new,
+            'active_users': active,
+            'returning_users': active and not new,
+        })
+        breakdowns[site_id]['age', get_age_group(date_of_birth, day)] += 1
+        for field, value in zip(BREAKDOWN_FIELDS, row[4:]):
+            breakdowns[site_id][field, value or ''] += 1
+
+    if totals is None:
+        totals = dict(DailyUserStats.objects.filter(
+            date=day - timedelta(days=1)).values_list('site', 'total_users'))
+    if not totals:
+        totals = count_users_joined_before(start)
+    totals = dict(
+        (site_id, totals.get(site_id, 0) + stats[site_id]['new_users'])
+        for site_id in set(stats) | set(totals))
+
+    with transaction.atomic():
+        DailyUserStats.objects.filter(date=day).delete()
+        for site_id, total in totals.items():
+            daily_stats = DailyUserStats.objects.create(
+                site_id=site_id, date=day, total_users=total,
+                **dict((key, stats[site_id][key]) for key in (
+                    'new_users', 'active_users', 'returning_users')))
+            DailyUserStatsBreakdown.objects.bulk_create([
+                DailyUserStatsBreakdown(
+                    stats=daily_stats, field=field, value=value[:128],
+                    users=users)
+                for (field, value), users in sorted(
+                    breakdowns[site_id].items())])
+    return totals
+
+
+@task(ignore_result=True)
+def update_daily_user_stats():
+    """
+    Roll up each day since the last one that was rolled up, up to
+    yesterday. The first time only yesterday is rolled up.
+    """
+    yesterday = timezone.localtime(timezone.now()).date() - timedelta(days=1)
+    latest = DailyUserStats.objects.aggregate(Max('date'))['date__max']
+    day = latest + timedelta(days=1) if latest else yesterday
+    totals = None
+    while day <= yesterday:
+        totals = rollup_daily_user_stats(day, totals)
+        day += timedelta(days=1)
+    return yesterday
+
+
+@task(ignore_result=True)
+def recount_daily_user_totals():
+    """
+    Count the totals of the latest rolled up day again from all the users,
+    so users imported with an earlier date_joined are included. The days
+    rolled up after it carry on from the recounted totals.
+    """
+    latest = DailyUserStats.objects.aggregate(Max('date'))['date__max']
+    if latest is None:
+        return
+    totals = count_users_joined_before(get_day_window(latest)[1])
+    with transaction.atomic():
+        for stats in DailyUserStats.objects.filter(date=latest):
+            stats.total_users = totals.pop(stats.site_id, 0)
+            stats.save(update_fields=['total_users'])
+        DailyUserStats.objects.bulk_create([
+            DailyUserStats(site_id=site_id, date=latest, total_users=total)
+            for site_id, total in totals.items()])
+
+
+def get_daily_user_stats(day):
+    return [
+        {'profile__site': stats.site_id, 'total': stats.total_users,
+         'new': stats.new_users, 'returning': stats.returning_users}
+        for stats in DailyUserStats.objects.filter(
+            date=day).order_by('site')]
 
 
 @task(serializer='json')
 def send_user_data_to_slack():
+    """
+    Send yesterday's rolled up user stats to each of the notifiers.
+    """
+    configs = notifiers.get_notifier_configs()
+    if not configs:
+        return
+    day = update_daily_user_stats()
+    text = get_message_text(get_daily_user_stats(day), day)
+    for path, kwargs in configs:
+        send_notification.delay(path, kwargs, text)
+
+
+@task(bind=True, ignore_result=True,
+      max_retries=getattr(settings, 'PROFILES_NOTIFIER_RETRIES', 5))
+def send_notification(self, path, kwargs, text):
+    """
+    Send the text with one notifier, backing off exponentially from a
+    minute between attempts if it fails.
+    """
     try:
-        url = settings.SLACK_INCOMING_WEBHOOK_URL
-        headers = {
-            'Content-Type': 'application/json',
-            'Accept': 'application/json',
-        }
-        data = {
-            "text": get_message_text()
-        }
-        requests.post(url, json=data, headers=headers)
-    except AttributeError:
-        pass
+        notifiers.get_notifier(path, kwargs).send(text)
+    except (requests.RequestException, IOError) as exc:
+        raise self.retry(exc=exc, countdown=60 * 2 ** self.request.retries)
+
+
+def get_export_storage():
+    """
+    Exports are kept out of the public media storage, in a directory
+    that's only served by export_download to staff with a valid token.
+    The directory has to be shared by the Celery workers and the web
+    processes.
+    """
+    return FileSystemStorage(location=getattr(
+        settings, 'PROFILES_EXPORT_ROOT',
+        os.path.join(tempfile.gettempdir(), 'molo-profiles-exports')))
+
+
+def get_export_expiry():
+    return getattr(settings, 'PROFILES_EXPORT_EXPIRY', 24 * 60 * 60)
+
+
+def make_export_token(name, user_id=None):
+    return signing.dumps(
+        {'name': name, 'user': user_id}, salt=EXPORT_TOKEN_SALT)
+
+
+def read_export_token(token):
+    """
+    The name of the export and the id of the user it was made for, or
+    raises signing.BadSignature once the token has expired.
+    """
+    data = signing.loads(
+        token, salt=EXPORT_TOKEN_SALT, max_age=get_export_expiry())
+    return data['name'], data['user']
+
+
+def get_export_url(token):
+    url = reverse('molo_profiles_export_download', args=(token, ))
+    return getattr(settings, 'BASE_URL', '').rstrip('/') + url
 
 
 @task(ignore_result=True)
-def send_export_email(recipient, arguments):
-    csvfile = FrontendUsersResource().export(
-        User.objects.filter(is_staff=False, **arguments)).csv
+def delete_old_exports():
+    storage = get_export_storage()
+    if not os.path.isdir(storage.location):
+        return
+    expired = timezone.now() - timedelta(seconds=get_export_expiry())
+    for name in storage.listdir('')[1]:
+        if timezone.make_aware(storage.modified_time(name)) < expired:
+            storage.delete(name)
+
+
+@task(ignore_result=True)
+def send_export_email(recipient, arguments, user_id=None):
+    chunk_size = getattr(settings, 'PROFILES_EXPORT_CHUNK_SIZE', 2000)
+    compress = getattr(settings, 'PROFILES_EXPORT_COMPRESS', False)
+    max_attachment_size = getattr(
+        settings, 'PROFILES_EXPORT_MAX_ATTACHMENT_SIZE', 10 * 1024 * 1024)
+
+    queryset = User.objects.filter(is_staff=False, **arguments)
+    filename = 'Molo_export_%s.csv' % settings.SITE_NAME
+    mimetype = 'text/csv'
     subject = 'Molo export: %s' % settings.SITE_NAME
     from_email = settings.DEFAULT_FROM_EMAIL
     msg = EmailMultiAlternatives(subject, '', from_email, (recipient,))
-    msg.attach(
-        'Molo_export_%s.csv' % settings.SITE_NAME,
-        csvfile, 'text/csv')
+
+    with SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE) as spool:
+        if compress:
+            filename += '.gz'
+            mimetype = 'application/gzip'
+            with gzip.GzipFile(
+                    filename=filename[:-3], mode='wb', fileobj=spool) as gz:
+                FrontendUsersResource().export_to_file(
+                    queryset, gz, chunk_size)
+        else:
+            FrontendUsersResource().export_to_file(
+                queryset, spool, chunk_size)
+
+        size = spool.tell()
+        spool.seek(0)
+        if size <= max_attachment_size:
+            msg.attach(filename, spool.read(), mimetype)
+        else:
+            # too big to attach, store it privately and send a link that
+            # only works for staff and expires
+            delete_old_exports()
+            name = get_export_storage().save(
+                '%s_%s' % (uuid.uuid4().hex, filename),
+                File(spool, name=filename))
+            msg.body = (
+                'Your export can be downloaded here until it expires: %s' % (
+                    get_export_url(make_export_token(name, user_id)), ))
     msg.send()
+
+
+def get_post_registration_hooks():
+    return getattr(settings, 'PROFILES_POST_REGISTRATION_HOOKS', [])
+
+
+def queue_post_registration_hooks(user):
+    """
+    Queue a task for each post registration hook once the registration
+    has been committed, so the hooks don't hold up the response.
+    """
+    for hook in get_post_registration_hooks():
+        transaction.on_commit(
+            lambda hook=hook: run_post_registration_hook.delay(hook, user.pk))
+
+
+@task(bind=True, ignore_result=True,
+      max_retries=getattr(
+          settings, 'PROFILES_POST_REGISTRATION_HOOK_RETRIES', 3),
+      default_retry_delay=60)
+def run_post_registration_hook(self, hook, user_id):
+    """
+    Call the hook, given by its dotted path, with the newly registered
+    user. Failing hooks are retried.
+    """
+    try:
+        import_string(hook)(User.objects.get(pk=user_id))
+    except Exception as exc:
+        raise self.retry(exc=exc)
@@ -1,17 +1,23 @@
 # -*- coding: utf-8 -*-
+from django.db import connection
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User, Group, Permission
 from django.contrib.contenttypes.models import ContentType
 from django.test.client import Client
 from django.core.urlresolvers import reverse
-from datetime import date
+from django.utils import timezone
+from datetime import date, timedelta
+import tablib
 from collections import OrderedDict
 from molo.core.tests.base import MoloTestCaseMixin
 from molo.core.models import Main, Languages, SiteLanguageRelation
 from molo.profiles.admin import ProfileUserAdmin, download_as_csv
 from molo.profiles.models import (
-    SecurityQuestion, SecurityAnswer, SecurityQuestionIndexPage, UserProfile)
+    SecurityQuestion, SecurityAnswer, SecurityQuestionIndexPage, UserProfile,
+    UserProfilesSettings)
 from molo.profiles.admin import MultiSiteUserResource
+from molo.profiles.admin_import_export import FrontendUsersResource
 
 
 class PermissionsTestCase(TestCase, MoloTestCaseMixin):
@@ -168,6 +174,82 @@ class TestFrontendUsersAdminView(TestCase, MoloTestCaseMixin):
         self.assertContains(response, self.user.username)
         self.assertNotContains(response, self.superuser.email)
 
+    def create_users(self, count):
+        date_joined = timezone.now()
+        User.objects.bulk_create([
+            User(username='user%s' % i,
+                 date_joined=date_joined - timedelta(hours=i // 2))
+            for i in range(count)])
+        UserProfile.objects.bulk_create([
+            UserProfile(user=user, site=self.site)
+            for user in User.objects.filter(username__startswith='user')])
+
+    def test_users_paged_by_date_joined(self):
+        self.create_users(205)
+        expected = list(User.objects.filter(
+            profile__site=self.site).order_by(
+            '-date_joined', '-pk').values_list('pk', flat=True))
+
+        pages = []
+        queries = []
+        url = '/admin/auth/user/'
+        # warm up the caches
+        self.client.get(url)
+        while url:
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.get(url)
+            queries.append(captured)
+            pages.append(
+                [user.pk for user in response.context['object_list']])
+            self.assertEqual(response.context['result_count'], 207)
+            self.assertContains(response, '207 users.')
+            url = response.context['next_url']
+            if url:
+                url = '/admin/auth/user/%s' % url
+
+        self.assertEqual([len(page) for page in pages], [100, 100, 7])
+        self.assertEqual(sum(pages, []), expected)
+        # the deepest page costs the same as the first
+        self.assertEqual(len(queries[0]), len(queries[-1]))
+        for captured in queries:
+            for query in captured.captured_queries:
+                self.assertFalse('OFFSET' in query['sql'])
+                self.assertFalse('wagtailcore_site"."id" = ' in query['sql'])
+
+        response = self.client.get(
+            '/admin/auth/user/%s' % response.context['previous_url'])
+        self.assertEqual(
+            [user.pk for user in response.context['object_list']], pages[1])
+
+    def test_users_ordered_by_column_paged_by_offset(self):
+        self.create_users(5)
+        response = self.client.get('/admin/auth/user/?o=0')
+        self.assertEqual(response.context['paginator'].count, 7)
+        self.assertEqual(
+            [user.username for user in response.context['object_list']],
+            sorted(User.objects.values_list('username', flat=True)))
+
+    def test_search_by_profile_fields(self):
+        profile = self.user.profile
+        profile.alias = 'The Alias'
+        profile.mobile_number = '+27784667723'
+        profile.save()
+        profile_settings = UserProfilesSettings.for_site(self.site)
+        profile_settings.country_code = '+27'
+        profile_settings.save()
+        for search_term in ('testing', 'alias', '078 466'):
+            response = self.client.get(
+                '/admin/auth/user/', {'q': search_term})
+            self.assertEqual(
+                list(response.context['object_list']), [self.user])
+        response = self.client.get('/admin/auth/user/', {'q': 'esting'})
+        self.assertEqual(list(response.context['object_list']), [])
+
+    @override_settings(PROFILES_ADMIN_ESTIMATED_COUNT=True)
+    def test_estimated_count(self):
+        response = self.client.get('/admin/auth/user/')
+        self.assertContains(response, 'About 2 users.')
+
     @override_settings(CELERY_ALWAYS_EAGER=True)
     def test_export_csv_redirects(self):
         profile = self.user.profile
@@ -386,3 +468,129 @@ class ImportExportTestCase(TestCase, MoloTestCaseMixin):
         for question in questions:
             self.assertTrue(SecurityAnswer.objects.filter(
                 question=question).exists())
+
+    def test_security_questions_resolved_once_per_import(self):
+        resource = MultiSiteUserResource()
+        resource.before_import(None, True, False)
+        hash_1 = ('pbkdf2_sha256$24000$WwoRrb5eO3SG$fghoNMPmIGhakF/L'
+                  '3uulZ37Ly9LNvR0UpFuhvjf7zQM=')
+
+        def data(username):
+            return OrderedDict([
+                ('security_question_answers', [
+                    ['Who am I?', hash_1], ['What is my name?', hash_1]]),
+                ('username', username),
+                ('migrated_username', username),
+                ('is_active', '1'),
+                ('site', str(self.site.pk)),
+                ('password', hash_1),
+                ('date_joined', '2017-09-07 08:43:18')])
+
+        resource.import_obj(obj=User(), data=data('first'), dry_run=True)
+        self.assertEquals(SecurityQuestion.objects.count(), 2)
+        with self.assertNumQueries(0):
+            question = resource.get_security_question(self.site, 'Who am I?')
+        self.assertEquals(question.title, 'Who am I?')
+
+        # the second row's answers need no question lookups at all
+        with CaptureQueriesContext(connection) as context:
+            resource.import_obj(obj=User(), data=data('second'), dry_run=True)
+        self.assertFalse(any(
+            'wagtailcore_page' in query['sql']
+            for query in context.captured_queries))
+        self.assertEquals(SecurityQuestion.objects.count(), 2)
+        self.assertEquals(SecurityAnswer.objects.count(), 4)
+
+    def test_bulk_import(self):
+        User.objects.create_user(username='1_existing', password='1234')
+        hash_1 = ('pbkdf2_sha256$24000$WwoRrb5eO3SG$fghoNMPmIGhakF/L'
+                  '3uulZ37Ly9LNvR0UpFuhvjf7zQM=')
+        dataset = tablib.Dataset(headers=[
+            'username', 'password', 'first_name', 'last_name', 'email',
+            'is_active', 'date_joined', 'alias', 'gender', 'date_of_birth',
+            'mobile_number', 'migrated_username', 'site',
+            'security_question_answers'])
+        dataset.append([
+            'existing', hash_1, '', '', '', '1', '2017-09-07 08:43:18',
+            '', '', '', '', 'existing', '1', []])
+        dataset.append([
+            'newuser', hash_1, 'New', '', 'new@example.com', '1',
+            '2017-09-07 08:43:18', 'The Alias', 'female', '1985-01-01',
+            '+27784667723', 'newuser', str(self.site2.pk),
+            [['Who am I?', hash_1]]])
+        dataset.append([
+            'another', hash_1, '', '', '', '0', '2017-09-07 08:43:18',
+            '', '', '', '', 'another', '', []])
+
+        progress = []
+        resource = MultiSiteUserResource()
+        imported = resource.bulk_import(
+            dataset, batch_size=2,
+            progress=lambda *args: progress.append(args))
+
+        self.assertEquals(imported, 2)
+        self.assertEquals(progress, [(2, 1, 3), (3, 2, 3)])
+        user = User.objects.get(username='%s_newuser' % self.site2.pk)
+        self.assertEquals(user.password, hash_1)
+        self.assertEquals(user.first_name, 'New')
+        self.assertEquals(user.email, 'new@example.com')
+        self.assertEquals(user.profile.alias, 'The Alias')
+        self.assertEquals(user.profile.gender, 'female')
+        self.assertEquals(user.profile.date_of_birth, date(1985, 1, 1))
+        self.assertEquals(user.profile.migrated_username, 'newuser')
+        self.assertEquals(user.profile.site, self.site2)
+        [answer] = user.profile.securityanswer_set.all()
+        self.assertEquals(answer.answer, hash_1)
+        self.assertEquals(answer.question.title, 'Who am I?')
+        self.assertTrue(answer.question.get_ancestors().filter(
+            pk=self.main2.pk).exists())
+
+        user = User.objects.get(username='another')
+        self.assertFalse(user.is_active)
+        self.assertEquals(user.profile.site, self.site)
+
+
+class ExportQueryCountTestCase(TestCase, MoloTestCaseMixin):
+    def setUp(self):
+        self.mk_main()
+        self.security_index = SecurityQuestionIndexPage(
+            title='Security Questions',
+            slug='security_questions',
+        )
+        self.main.add_child(instance=self.security_index)
+        self.security_index.save()
+        self.question = SecurityQuestion(
+            title="How old are you?",
+            slug="how-old-are-you",
+        )
+        self.security_index.add_child(instance=self.question)
+        self.question.save()
+        self.mk_users(2)
+
+    def mk_users(self, count):
+        for i in range(User.objects.count(), User.objects.count() + count):
+            user = User.objects.create_user(
+                username='tester%s' % i, password='tester')
+            user.profile.alias = 'Alias %s' % i
+            user.profile.site = self.site
+            user.profile.save()
+            SecurityAnswer.objects.create(
+                user=user.profile, question=self.question, answer='20')
+        # a user without a profile must not cost an extra query either
+        UserProfile.objects.filter(user__username='tester0').delete()
+
+    def assertConstantQueries(self, export):
+        with CaptureQueriesContext(connection) as context:
+            export()
+        self.mk_users(5)
+        with self.assertNumQueries(len(context.captured_queries)):
+            export()
+
+    def test_frontend_users_export_query_count(self):
+        resource = FrontendUsersResource()
+        self.assertConstantQueries(
+            lambda: resource.export(User.objects.all()).csv)
+
+    def test_multi_site_users_export_query_count(self):
+        resource = MultiSiteUserResource()
+        self.assertConstantQueries(lambda: resource.export().csv)
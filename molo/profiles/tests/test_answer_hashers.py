@@ -0,0 +1,57 @@
+from django.contrib.auth import hashers
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+from molo.core.tests.base import MoloTestCaseMixin
+from molo.profiles import answer_hashers
+from molo.profiles.models import (
+    SecurityAnswer, SecurityQuestion, SecurityQuestionIndexPage)
+
+
+class AnswerHashersTestCase(MoloTestCaseMixin, TestCase):
+
+    def setUp(self):
+        self.mk_main()
+        self.user = User.objects.create_user(
+            username='tester', password='tester')
+        self.question = SecurityQuestion(title='How old are you?')
+        SecurityQuestionIndexPage.objects.descendant_of(
+            self.main).first().add_child(instance=self.question)
+        self.question.save_revision().publish()
+
+    @override_settings(PROFILES_SECURITY_ANSWER_WORK_FACTOR=1000)
+    def test_answers_use_the_answer_work_factor(self):
+        answer = SecurityAnswer.objects.create(
+            user=self.user.profile, question=self.question, answer=' Twenty ')
+        self.assertTrue(answer.answer.startswith('pbkdf2_sha256$1000$'))
+        self.assertTrue(answer.check_answer('twenty'))
+        self.assertFalse(answer.check_answer('thirty'))
+        # passwords are left alone
+        self.assertFalse(User.objects.get(
+            pk=self.user.pk).password.startswith('pbkdf2_sha256$1000$'))
+
+    def test_answers_rehashed_when_the_policy_changes(self):
+        answer = SecurityAnswer.objects.create(
+            user=self.user.profile, question=self.question, answer='20')
+        self.assertTrue(answer.answer.startswith(
+            'pbkdf2_sha256$%s$' % hashers.get_hasher().iterations))
+
+        with override_settings(PROFILES_SECURITY_ANSWER_WORK_FACTOR=1000):
+            self.assertTrue(answer.check_answer('20'))
+        self.assertTrue(SecurityAnswer.objects.get(
+            pk=answer.pk).answer.startswith('pbkdf2_sha256$1000$'))
+
+    @override_settings(PROFILES_SECURITY_ANSWER_WORK_FACTOR=1)
+    def test_make_answers_in_a_pool(self):
+        raw_answers = [
+            'Answer %s' % i for i in range(answer_hashers.POOL_THRESHOLD)]
+        answers = answer_hashers.make_answers(raw_answers, processes=2)
+        self.assertEqual(len(answers), len(raw_answers))
+        for raw_answer, answer in zip(raw_answers, answers):
+            self.assertTrue(answer.startswith('pbkdf2_sha256$1$'))
+            self.assertTrue(answer_hashers.check_answer(raw_answer, answer))
+
+    def test_is_answer_hashed(self):
+        self.assertTrue(answer_hashers.is_answer_hashed(
+            answer_hashers.make_answer('20')))
+        self.assertFalse(answer_hashers.is_answer_hashed('20'))
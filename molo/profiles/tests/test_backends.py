@@ -0,0 +1,115 @@
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.test import TestCase, RequestFactory, override_settings
+
+from molo.core.tests.base import MoloTestCaseMixin
+from molo.profiles.backends import MoloProfilesModelBackend
+from molo.profiles.tests.test_views import CountingPasswordHasher
+
+
+class MoloProfilesModelBackendTestCase(MoloTestCaseMixin, TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.mk_main()
+        self.mk_main2()
+        self.backend = MoloProfilesModelBackend()
+        self.request = RequestFactory().get('/')
+        self.request.site = self.site
+        self.user = User.objects.create_user(
+            username='tester', password='1234')
+        self.migrated_user = User.objects.create_user(
+            username='%s_tester' % self.site.pk, password='5678')
+        self.migrated_user.profile.migrated_username = 'migrated'
+        self.migrated_user.profile.save()
+
+    def test_native_username_resolved_in_one_query(self):
+        with self.assertNumQueries(1):
+            user = self.backend.authenticate(
+                self.request, username='tester', password='1234')
+        self.assertEqual(user, self.user)
+        with self.assertRaises(PermissionDenied):
+            self.backend.authenticate(
+                self.request, username='tester', password='5678')
+
+    def test_migrated_username(self):
+        user = self.backend.authenticate(
+            self.request, username='migrated', password='5678')
+        self.assertEqual(user, self.migrated_user)
+        with self.assertRaises(PermissionDenied):
+            self.backend.authenticate(
+                self.request, username='migrated', password='1234')
+
+    def test_migrated_username_shadowed_by_native_username(self):
+        self.migrated_user.profile.migrated_username = 'tester'
+        self.migrated_user.profile.save()
+        self.assertEqual(self.backend.authenticate(
+            self.request, username='tester', password='1234'), self.user)
+        self.assertEqual(self.backend.authenticate(
+            self.request, username='tester', password='5678'),
+            self.migrated_user)
+
+    def test_other_sites_users_denied(self):
+        self.request.site = self.site2
+        with self.assertRaises(PermissionDenied):
+            self.backend.authenticate(
+                self.request, username='tester', password='1234')
+
+    @override_settings(PASSWORD_HASHERS=[
+        'molo.profiles.tests.test_views.CountingPasswordHasher'])
+    def test_unknown_usernames_cached(self):
+        CountingPasswordHasher.encoded = 0
+        with self.assertRaises(PermissionDenied):
+            self.backend.authenticate(
+                self.request, username='unknown', password='1234')
+        self.assertEqual(CountingPasswordHasher.encoded, 1)
+
+        with self.assertNumQueries(0):
+            with self.assertRaises(PermissionDenied):
+                self.backend.authenticate(
+                    self.request, username='unknown', password='1234')
+        # the same work is done whether or not the username is cached
+        self.assertEqual(CountingPasswordHasher.encoded, 2)
+
+        # through the other backends too
+        self.assertEqual(authenticate(
+            request=self.request, username='unknown', password='1234'), None)
+        self.assertEqual(CountingPasswordHasher.encoded, 3)
+
+    @override_settings(PASSWORD_HASHERS=[
+        'molo.profiles.tests.test_views.CountingPasswordHasher'])
+    def test_wrong_passwords_cost_the_same_as_unknown_usernames(self):
+        def hashes(username, password):
+            CountingPasswordHasher.encoded = 0
+            self.assertEqual(authenticate(
+                request=self.request, username=username,
+                password=password), None)
+            return CountingPasswordHasher.encoded
+
+        self.user.set_password('1234')
+        self.user.save()
+        self.migrated_user.set_password('5678')
+        self.migrated_user.save()
+        self.assertEqual(hashes('tester', 'wrong'), 1)
+        self.assertEqual(hashes('migrated', 'wrong'), 1)
+        self.assertEqual(hashes('unknown', 'wrong'), 1)
+        self.assertEqual(hashes('unknown', 'wrong'), 1)
+
+    def test_registered_usernames_forgotten(self):
+        with self.assertRaises(PermissionDenied):
+            self.backend.authenticate(
+                self.request, username='newuser', password='1234')
+        user = User.objects.create_user(username='newuser', password='1234')
+        self.assertEqual(self.backend.authenticate(
+            self.request, username='newuser', password='1234'), user)
+
+        with self.assertRaises(PermissionDenied):
+            self.backend.authenticate(
+                self.request, username='renamed', password='5678')
+        self.migrated_user.profile.migrated_username = 'renamed'
+        self.migrated_user.profile.save()
+        self.assertEqual(self.backend.authenticate(
+            self.request, username='renamed', password='5678'),
+            self.migrated_user)
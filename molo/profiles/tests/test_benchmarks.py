@@ -0,0 +1,79 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from molo.core.models import Languages, SiteLanguageRelation
+from molo.core.tests.base import MoloTestCaseMixin
+from molo.profiles import benchmarks
+from molo.profiles.models import SecurityQuestion, UserProfilesSettings
+
+
+class BenchmarksTestCase(MoloTestCaseMixin, TestCase):
+
+    def setUp(self):
+        self.mk_main()
+
+    def run_benchmark(self, name, **kwargs):
+        stdout = StringIO()
+        call_command('profiles_benchmark', name, stdout=stdout, **kwargs)
+        return stdout.getvalue()
+
+    def test_user_import(self):
+        output = self.run_benchmark('user_import', count=10)
+        self.assertTrue('bulk_import:' in output)
+        # the benchmark leaves nothing behind
+        self.assertEqual(User.objects.count(), 0)
+
+    def test_registration(self):
+        output = self.run_benchmark('registration', count=5)
+        self.assertTrue('register_user:' in output)
+        self.assertEqual(User.objects.count(), 0)
+
+    def test_login(self):
+        output = self.run_benchmark('login', count=20)
+        self.assertTrue('migrated username:' in output)
+        self.assertEqual(User.objects.count(), 0)
+
+    def test_page_render(self):
+        language_setting = Languages.objects.create(site_id=self.site.pk)
+        SiteLanguageRelation.objects.create(
+            language_setting=language_setting, locale='en', is_active=True)
+        cache.set(
+            SecurityQuestion.catalog_cache_key(self.site.pk, 'en'), [])
+        output = self.run_benchmark('page_render', count=1)
+        # nothing read from the rolled back rows is left in the cache
+        self.assertEqual(
+            cache.get(UserProfilesSettings.cache_key(self.site.pk)), None)
+        self.assertEqual(
+            cache.get(SecurityQuestion.catalog_cache_key(self.site.pk, 'en')),
+            None)
+        self.assertFalse(UserProfilesSettings.for_site(
+            self.site).show_security_question_fields)
+        self.assertTrue(' objects, ' in output)
+        for name in ('register', 'forgot_password'):
+            self.assertTrue('%s (anonymous, 5 questions):' % name in output)
+        for name in ('done', 'viewprofile', 'editprofile'):
+            self.assertTrue('%s (logged in, 0 questions):' % name in output)
+            self.assertFalse('%s (anonymous' % name in output)
+        self.assertEqual(User.objects.count(), 0)
+
+        with self.settings(PROFILES_BENCHMARK_THRESHOLDS={
+                'register': {'queries': 1000}}):
+            self.run_benchmark('page_render', count=1)
+        with self.settings(PROFILES_BENCHMARK_THRESHOLDS={
+                'viewprofile': {'queries': 1}}):
+            with self.assertRaises(CommandError) as cm:
+                self.run_benchmark('page_render', count=1)
+        self.assertTrue(
+            'viewprofile (logged in, 5 questions): queries' in
+            str(cm.exception))
+        self.assertFalse('register' in str(cm.exception))
+
+        if benchmarks.tracemalloc is None:
+            with self.settings(PROFILES_BENCHMARK_THRESHOLDS={
+                    'register': {'kb': 512}}):
+                with self.assertRaises(CommandError):
+                    self.run_benchmark('page_render', count=1)
@@ -0,0 +1,87 @@
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from molo.core.tests.base import MoloTestCaseMixin
+from molo.profiles.content_filter import BLOCKED, EMAIL, PHONE, ContentFilter
+from molo.profiles.forms import RegistrationForm
+from molo.profiles.models import UserProfilesSettings
+
+
+class ContentFilterTestCase(MoloTestCaseMixin, TestCase):
+
+    def setUp(self):
+        self.mk_main()
+        self.profile_settings = UserProfilesSettings.for_site(self.site)
+
+    def test_check_reports_the_reason(self):
+        content_filter = ContentFilter(
+            prevent_phone=True, prevent_email=True,
+            patterns=(r'^admin', ), blocklist=('BadWord', ))
+        self.assertEqual(content_filter.check('0821234567'), PHONE)
+        self.assertEqual(content_filter.check('me@example.com'), EMAIL)
+        self.assertEqual(content_filter.check('administrator'), BLOCKED)
+        self.assertEqual(content_filter.check('mybadwords'), BLOCKED)
+        self.assertEqual(content_filter.check('the_admin'), None)
+        self.assertTrue(content_filter.is_allowed('tester'))
+
+    def test_filter_compiled_once_per_settings(self):
+        content_filter = ContentFilter.for_settings(self.profile_settings)
+        self.assertIs(
+            ContentFilter.for_settings(
+                UserProfilesSettings.for_site(self.site)),
+            content_filter)
+
+        self.profile_settings.username_blocklist = 'spam\neggs'
+        self.profile_settings.save()
+        content_filter = ContentFilter.for_settings(
+            UserProfilesSettings.for_site(self.site))
+        self.assertFalse(content_filter.is_allowed('greeneggs'))
+
+    def test_blocked_username_and_alias(self):
+        self.profile_settings.username_blocked_patterns = r'^mxit'
+        self.profile_settings.username_blocklist = 'badword'
+        self.profile_settings.save()
+        form = RegistrationForm(data={
+            'username': 'mxit_user',
+            'alias': 'BADWORD',
+            'password': '1234',
+            'terms_and_conditions': True
+        })
+        self.assertFalse(form.is_valid())
+        self.assertEqual(
+            form.errors['username'],
+            ['Sorry, but that username is not allowed.'])
+        self.assertEqual(
+            form.errors['alias'],
+            ['Sorry, but that display name is not allowed.'])
+
+    def test_invalid_pattern_rejected(self):
+        self.profile_settings.username_blocked_patterns = 'fine\n(broken'
+        with self.assertRaises(ValidationError) as cm:
+            self.profile_settings.full_clean()
+        self.assertTrue(
+            'username_blocked_patterns' in cm.exception.message_dict)
+
+    def test_patterns_referring_to_groups(self):
+        self.profile_settings.prevent_email_in_username = True
+        self.profile_settings.prevent_phone_number_in_username = True
+        self.profile_settings.username_blocked_patterns = (
+            '(ab)\\1\n(?P<phone>^mxit)\n(?i)^ADMIN')
+        self.profile_settings.full_clean()
+        content_filter = ContentFilter.for_settings(self.profile_settings)
+        self.assertEqual(content_filter.check('xabab'), BLOCKED)
+        self.assertEqual(content_filter.check('xab'), None)
+        self.assertEqual(content_filter.check('mxit_user'), BLOCKED)
+        self.assertEqual(content_filter.check('Administrator'), BLOCKED)
+        self.assertEqual(content_filter.check('me@example.com'), EMAIL)
+        # the inline flag only applies to its own pattern
+        self.assertEqual(content_filter.check('MXIT'), None)
+
+    def test_benchmark(self):
+        stdout = StringIO()
+        call_command(
+            'profiles_benchmark', 'username_filter', count=100,
+            stdout=stdout)
+        self.assertTrue('compiled filter:' in stdout.getvalue())
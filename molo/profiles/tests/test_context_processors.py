@@ -49,3 +49,15 @@ class ContextProcessorsTest(TestCase, MoloTestCaseMixin):
         self.assertEqual(context['username'], '')
         self.assertEqual(context['date_of_birth'], '')
         self.assertEqual(context['alias'], '')
+
+    def test_get_profile_data_is_lazy(self):
+        request = self.factory.get('/')
+        request.user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            context = get_profile_data(request)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(context['alias'], 'Anonymous')
+            self.assertEqual(context['username'], 'tester')
+        self.assertEqual(
+            context['edit_profile_form'].initial['alias'], 'Anonymous')
@@ -0,0 +1,58 @@
+from django.test import TestCase
+
+from molo.core.tests.base import MoloTestCaseMixin
+from molo.profiles.field_schema import (
+    DONE, EDIT, REGISTRATION, ProfileFieldSchema)
+from molo.profiles.forms import DoneForm, EditProfileForm, RegistrationForm
+from molo.profiles.models import UserProfilesSettings
+
+
+class ProfileFieldSchemaTestCase(MoloTestCaseMixin, TestCase):
+
+    def setUp(self):
+        self.mk_main()
+        self.profile_settings = UserProfilesSettings.for_site(self.site)
+        self.profile_settings.activate_display_name = True
+        self.profile_settings.capture_display_name_on_reg = True
+        self.profile_settings.display_name_required = True
+        self.profile_settings.activate_dob = True
+        self.profile_settings.dob_required = True
+        self.profile_settings.activate_gender = True
+        self.profile_settings.save()
+
+    def test_fields_per_stage(self):
+        schema = ProfileFieldSchema.for_settings(self.profile_settings)
+        self.assertEqual(schema.fields[REGISTRATION], {
+            'mobile_number': False, 'email': False, 'alias': True})
+        self.assertEqual(schema.fields[DONE], {
+            'date_of_birth': True, 'gender': False})
+        self.assertEqual(schema.fields[EDIT], {
+            'mobile_number': False, 'email': False, 'alias': True,
+            'date_of_birth': True, 'gender': False})
+
+    def test_compiled_once_per_settings(self):
+        schema = ProfileFieldSchema.for_settings(self.profile_settings)
+        self.assertIs(ProfileFieldSchema.for_settings(
+            UserProfilesSettings.for_site(self.site)), schema)
+
+        self.profile_settings.capture_dob_on_reg = True
+        self.profile_settings.save()
+        schema = ProfileFieldSchema.for_settings(
+            UserProfilesSettings.for_site(self.site))
+        self.assertTrue(schema.fields[REGISTRATION]['date_of_birth'])
+        self.assertFalse('date_of_birth' in schema.fields[DONE])
+
+    def test_forms_use_the_schema(self):
+        form = RegistrationForm(questions=[])
+        self.assertTrue(form.fields['alias'].required)
+        self.assertFalse(form.fields['date_of_birth'].required)
+
+        form = DoneForm()
+        self.assertFalse(form.fields['alias'].required)
+        self.assertTrue(form.fields['date_of_birth'].required)
+        self.assertFalse(form.fields['location'].required)
+
+        form = EditProfileForm()
+        self.assertTrue(form.fields['alias'].required)
+        self.assertTrue(form.fields['date_of_birth'].required)
+        self.assertFalse(form.fields['gender'].required)
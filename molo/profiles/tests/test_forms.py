@@ -1,10 +1,11 @@
-from django.test import TestCase
+from django.test import TestCase, RequestFactory
 from django.contrib.auth.models import User
 
 from molo.profiles.forms import (
     ForgotPasswordForm, RegistrationForm, ProfilePasswordChangeForm)
 from molo.core.tests.base import MoloTestCaseMixin
-from molo.profiles.models import SecurityQuestion, SecurityQuestionIndexPage
+from molo.profiles.models import (
+    SecurityQuestion, SecurityQuestionIndexPage, UserProfilesSettings)
 
 
 class RegisterTestCase(MoloTestCaseMixin, TestCase):
@@ -116,6 +117,42 @@ class RegisterTestCase(MoloTestCaseMixin, TestCase):
         )
         self.assertEqual(form.is_valid(), False)
 
+    def test_validation_uses_request_site_without_site_lookups(self):
+        self.mk_main2()
+        profile_settings = UserProfilesSettings.for_site(self.site2)
+        profile_settings.prevent_email_in_username = True
+        profile_settings.save()
+        request = RequestFactory().post('/')
+        request.site = self.site2
+        form_data = {
+            'username': 'test@test.com',
+            'alias': 'alias@test.com',
+            'password': '1234',
+            'terms_and_conditions': True
+        }
+        form = RegistrationForm(
+            data=form_data,
+            questions=[self.question, ],
+            request=request
+        )
+        # only the username uniqueness check hits the database
+        with self.assertNumQueries(1):
+            self.assertFalse(form.is_valid())
+        self.assertEqual(
+            form.errors['username'],
+            ["Sorry, but that is an invalid username. Please don't use "
+             "your email address in your username."])
+        self.assertTrue('alias' in form.errors)
+
+        request = RequestFactory().post('/')
+        request.site = self.site
+        form = RegistrationForm(
+            data=form_data,
+            questions=[self.question, ],
+            request=request
+        )
+        self.assertTrue(form.is_valid())
+
 
 class PasswordRecoveryTestCase(MoloTestCaseMixin, TestCase):
 
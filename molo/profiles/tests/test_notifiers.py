@@ -0,0 +1,114 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from django.test import TestCase, override_settings
+from django.utils.six.moves import BaseHTTPServer, socketserver
+
+from molo.core.tests.base import MoloTestCaseMixin
+from molo.profiles import notifiers, task
+from molo.profiles.notifiers import FileNotifier, SlackNotifier
+
+
+class StandInHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        server.requests.append(json.loads(body.decode('utf-8')))
+        status = server.statuses.pop(0) if server.statuses else 200
+        if server.delay:
+            time.sleep(server.delay)
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients that time out hang up before they're answered
+        pass
+
+
+@override_settings(CELERY_ALWAYS_EAGER=True)
+class NotifiersTestCase(MoloTestCaseMixin, TestCase):
+
+    def setUp(self):
+        self.mk_main()
+        self.server = StandInServer(('127.0.0.1', 0), StandInHandler)
+        self.server.requests = []
+        self.server.statuses = []
+        self.server.delay = 0
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.url = 'http://127.0.0.1:%s/' % self.server.server_port
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tempdir)
+
+    def test_slack_notifier(self):
+        notifier = SlackNotifier(self.url)
+        notifier.send('first')
+        notifier.send('second')
+        self.assertEqual(
+            self.server.requests, [{'text': 'first'}, {'text': 'second'}])
+        self.assertTrue(notifiers.get_session() is notifiers.get_session())
+
+    def test_failed_notifications_retried(self):
+        self.server.statuses = [500, 503]
+        task.send_notification.apply(args=(
+            'molo.profiles.notifiers.WebhookNotifier',
+            {'url': self.url, 'field': 'message'}, 'stats'))
+        self.assertEqual(self.server.requests, [{'message': 'stats'}] * 3)
+
+    def test_slow_webhooks_time_out(self):
+        self.server.delay = 1
+        start = time.time()
+        task.send_notification.apply(args=(
+            'molo.profiles.notifiers.SlackNotifier',
+            {'url': self.url, 'timeout': (1, 0.1)}, 'stats'))
+        # the first attempt and each retry gave up waiting
+        self.assertTrue(time.time() - start < 1)
+        self.assertEqual(len(self.server.requests), 6)
+        # let the stand-in finish answering before it's shut down
+        time.sleep(self.server.delay)
+
+    def test_file_notifier(self):
+        path = os.path.join(self.tempdir, 'stats.log')
+        FileNotifier(path).send('first')
+        FileNotifier(path).send('second')
+        with open(path) as f:
+            self.assertEqual(f.read(), 'first\nsecond\n')
+
+    def test_send_user_data(self):
+        path = os.path.join(self.tempdir, 'stats.log')
+        with override_settings(PROFILES_USER_DATA_NOTIFIERS=[
+                ('molo.profiles.notifiers.SlackNotifier', {'url': self.url}),
+                ('molo.profiles.notifiers.FileNotifier', {'path': path})]):
+            task.send_user_data_to_slack()
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertTrue(
+            'Total Users: 0' in self.server.requests[0]['text'])
+        with open(path) as f:
+            self.assertEqual(
+                f.read(), '%s\n' % self.server.requests[0]['text'])
+
+    def test_no_notifiers_configured(self):
+        with override_settings(PROFILES_USER_DATA_NOTIFIERS=[]):
+            task.send_user_data_to_slack()
+        with override_settings(SLACK_INCOMING_WEBHOOK_URL=self.url):
+            self.assertEqual(notifiers.get_notifier_configs(), [
+                ('molo.profiles.notifiers.SlackNotifier', {'url': self.url})])
+        self.assertEqual(self.server.requests, [])
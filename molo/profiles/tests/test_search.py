@@ -0,0 +1,106 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from molo.core.tests.base import MoloTestCaseMixin
+from molo.profiles.models import (
+    UserProfile, UserSearchTerm, filter_by_search_terms)
+from molo.profiles.search import (
+    get_query_terms, get_search_terms, normalise_mobile_number)
+
+
+class SearchTermsTestCase(TestCase):
+
+    def test_normalise_mobile_number(self):
+        for value, expected in (
+                ('+27 78 466 7723', '+27784667723'),
+                ('0784667723', '+27784667723'),
+                ('(078) 466-7723', '+27784667723'),
+                ('0027784667723', '+27784667723'),
+                ('078466', '+2778466'),
+                ('27784667723', '+27784667723'),
+                ('tester', None),
+                ('+', None)):
+            self.assertEqual(
+                normalise_mobile_number(value, '+27'), expected)
+        self.assertEqual(normalise_mobile_number('0784667723'), None)
+
+    def test_search_terms(self):
+        self.assertEqual(
+            get_search_terms(
+                'Tester', '1_tester', 'The  Alias', '+27784667723'),
+            set(['tester', '1_tester', 'the alias', 'the', 'alias',
+                 '+27784667723']))
+        self.assertEqual(get_search_terms('tester'), set(['tester']))
+
+    def test_query_terms(self):
+        self.assertEqual(
+            get_query_terms('The Al'), [['the'], ['al']])
+        self.assertEqual(
+            get_query_terms('078 466', '+27'), [['078466', '+2778466']])
+
+
+class SearchTestCase(MoloTestCaseMixin, TestCase):
+
+    def setUp(self):
+        self.mk_main()
+        self.user = User.objects.create_user(username='tester')
+        self.user.profile.alias = 'Thabo Nkosi'
+        self.user.profile.mobile_number = '+27784667723'
+        self.user.profile.migrated_username = 'old_name'
+        self.user.profile.save()
+        self.other = User.objects.create_user(username='another')
+
+    def search(self, search_term, queryset=None):
+        return list(filter_by_search_terms(
+            queryset or User.objects.all(), search_term, '+27'))
+
+    def test_search(self):
+        for search_term in ('test', 'TESTER', 'old', 'nkos', 'thabo nk',
+                            '0784', '+27 78 466', '27784667723'):
+            self.assertEqual(self.search(search_term), [self.user])
+        for search_term in ('ester', 'thabo x', '0785'):
+            self.assertEqual(self.search(search_term), [])
+        self.assertEqual(
+            list(filter_by_search_terms(UserProfile.objects.all(), 'anoth')),
+            [self.other.profile])
+
+    def test_search_terms_kept_up_to_date(self):
+        self.user.username = 'renamed'
+        self.user.save()
+        self.assertEqual(self.search('renam'), [self.user])
+        self.assertEqual(self.search('tester'), [])
+
+        self.user.profile.alias = 'Sipho'
+        self.user.profile.save()
+        self.assertEqual(self.search('sip'), [self.user])
+        self.assertEqual(self.search('thabo'), [])
+        self.assertEqual(
+            UserSearchTerm.objects.filter(profile=self.user.profile).count(),
+            4)
+
+    def test_search_terms_only_written_when_changed(self):
+        def term_queries(func):
+            with CaptureQueriesContext(connection) as queries:
+                func()
+            return [
+                query['sql'].split()[0] for query in queries.captured_queries
+                if 'profiles_usersearchterm' in query['sql']]
+
+        profile = UserProfile.objects.get(user=self.user)
+        profile.gender = 'female'
+        self.assertEqual(term_queries(profile.save), [])
+        profile.alias = 'Sipho'
+        profile.save(update_fields=['gender'])
+        self.assertEqual(self.search('sip'), [])
+        self.assertEqual(term_queries(profile.save), ['DELETE', 'INSERT'])
+        self.assertEqual(self.search('sip'), [self.user])
+        self.assertEqual(term_queries(profile.save), [])
+
+        # new profiles have no terms to replace
+        self.assertEqual(term_queries(
+            lambda: User.objects.create_user(username='newcomer')),
+            ['INSERT'])
+        self.assertEqual(self.search('newc'), [User.objects.get(
+            username='newcomer')])
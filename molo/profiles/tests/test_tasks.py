@@ -1,13 +1,28 @@
 # -*- coding: utf-8 -*-
+import gzip
+import os
+import shutil
+import tempfile
+from io import BytesIO
+
 from django.core import mail
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
 from django.contrib.auth.models import User
 from django.conf import settings
 from molo.core.tests.base import MoloTestCaseMixin
 from molo.core.models import Main, Languages, SiteLanguageRelation
-from molo.profiles.task import send_export_email
+from molo.profiles.task import (
+    delete_old_exports, run_post_registration_hook, send_export_email)
 from django.core.urlresolvers import reverse
 
+hook_calls = []
+
+
+def flaky_hook(user):
+    hook_calls.append(user.username)
+    if len(hook_calls) < 3:
+        raise IOError('Service unavailable')
+
 
 class ModelsTestCase(TestCase, MoloTestCaseMixin):
     def setUp(self):
@@ -84,3 +99,97 @@ class ModelsTestCase(TestCase, MoloTestCaseMixin):
              ',' + str(
                  self.user2.last_login.strftime("%Y-%m-%d %H:%M:%S")) + '\r\n',
              'text/csv'))
+
+    @override_settings(PROFILES_EXPORT_CHUNK_SIZE=1)
+    def test_send_export_email_in_chunks(self):
+        for i in range(3):
+            user = User.objects.create_user(
+                username='chunked%s' % i, password='1234')
+            user.profile.site = self.site
+            user.profile.save()
+        send_export_email(self.user.email, {'profile__site': self.site})
+        message = list(mail.outbox)[0]
+        rows = message.attachments[0][1].split('\r\n')
+        self.assertEquals(
+            [row.split(',')[0] for row in rows[1:-1]],
+            ['testing1', 'chunked0', 'chunked1', 'chunked2'])
+
+    @override_settings(PROFILES_EXPORT_COMPRESS=True)
+    def test_send_export_email_compressed(self):
+        send_export_email(self.user.email, {'profile__site': self.site})
+        message = list(mail.outbox)[0]
+        filename, content, mimetype = message.attachments[0]
+        self.assertEquals(filename, 'Molo_export_testapp.csv.gz')
+        self.assertEquals(mimetype, 'application/gzip')
+        csvfile = gzip.GzipFile(fileobj=BytesIO(content)).read()
+        self.assertTrue(csvfile.startswith('username,alias,first_name'))
+        self.assertTrue('testing1,The Alias' in csvfile)
+
+    @override_settings(PROFILES_EXPORT_MAX_ATTACHMENT_SIZE=0)
+    def test_send_export_email_links_large_exports(self):
+        export_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, export_root)
+        staff = User.objects.create_superuser(
+            username='staff', email='staff@example.com', password='0000')
+        User.objects.create_superuser(
+            username='other', email='other@example.com', password='0000')
+
+        with self.settings(PROFILES_EXPORT_ROOT=export_root):
+            send_export_email(
+                staff.email, {'profile__site': self.site}, staff.pk)
+            message = list(mail.outbox)[0]
+            self.assertEquals(message.attachments, [])
+            url = message.body.split(': ')[-1]
+            self.assertTrue(url.startswith(settings.BASE_URL))
+            path = url[len(settings.BASE_URL):]
+
+            # the export isn't in the public media storage
+            self.assertFalse(settings.MEDIA_URL in url)
+            [name] = os.listdir(export_root)
+            self.assertTrue(name.endswith('_Molo_export_testapp.csv'))
+            self.assertFalse(name in url)
+
+            client = Client()
+            self.assertEquals(client.get(path).status_code, 302)
+            client.login(username='other', password='0000')
+            self.assertEquals(client.get(path).status_code, 404)
+            client.login(username='staff', password='0000')
+            response = client.get(path)
+            self.assertEquals(response.status_code, 200)
+            self.assertTrue(
+                'testing1,The Alias' in b''.join(response.streaming_content))
+            self.assertEquals(
+                response['Content-Disposition'],
+                'attachment; filename="Molo_export_testapp.csv"')
+
+            # the link and the file expire
+            with self.settings(PROFILES_EXPORT_EXPIRY=-1):
+                self.assertEquals(client.get(path).status_code, 404)
+                delete_old_exports()
+            self.assertEquals(os.listdir(export_root), [])
+
+
+class PostRegistrationHooksTestCase(TestCase, MoloTestCaseMixin):
+
+    def setUp(self):
+        self.mk_main()
+        del hook_calls[:]
+
+    @override_settings(PROFILES_POST_REGISTRATION_HOOKS=[
+        'molo.profiles.tests.test_tasks.flaky_hook'])
+    def test_hooks_deferred_until_commit(self):
+        # the test transaction is never committed
+        response = self.client.post(reverse('molo.profiles:user_register'), {
+            'username': 'testing',
+            'password': '1234',
+            'terms_and_conditions': True
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(hook_calls, [])
+
+    def test_failing_hooks_retried(self):
+        user = User.objects.create_user(username='testing', password='1234')
+        # eager retries run straight away
+        run_post_registration_hook.apply(args=(
+            'molo.profiles.tests.test_tasks.flaky_hook', user.pk))
+        self.assertEqual(hook_calls, ['testing', 'testing', 'testing'])
@@ -0,0 +1,74 @@
+import time
+
+from django.core.cache import cache
+from django.test import TestCase, RequestFactory, override_settings
+
+from molo.core.tests.base import MoloTestCaseMixin
+from molo.profiles.throttling import Throttle
+
+
+class ThrottleTestCase(MoloTestCaseMixin, TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.mk_main()
+        self.mk_main2()
+        self.request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.1')
+        self.request.site = self.site
+
+    def test_throttled_after_limit(self):
+        throttle = Throttle('login', limit=2, window=60)
+        self.assertFalse(throttle.attempt(self.request, 'tester'))
+        self.assertFalse(throttle.is_throttled(self.request, 'tester'))
+        self.assertFalse(throttle.attempt(self.request, 'Tester'))
+        self.assertTrue(throttle.is_throttled(self.request, 'tester'))
+        self.assertTrue(throttle.attempt(self.request, 'tester'))
+
+        # per site, username and scope
+        self.assertFalse(throttle.is_throttled(self.request, 'other'))
+        self.assertFalse(Throttle('forgot_password', limit=2).is_throttled(
+            self.request, 'tester'))
+        self.request.site = self.site2
+        self.assertFalse(throttle.is_throttled(self.request, 'tester'))
+
+    def test_sliding_window(self):
+        throttle = Throttle('login', limit=2, window=60)
+        key = throttle.get_cache_keys(self.request, 'tester')[0]
+        cache.set(throttle.get_window_key(key, 8), 10)
+        cache.set(throttle.get_window_key(key, 9), 4)
+        cache.set(throttle.get_window_key(key, 10), 1)
+        # three quarters into window 10 a quarter of window 9 still counts
+        self.assertEqual(throttle.get_counts([key], 10 * 60 + 45), [2.0])
+        self.assertEqual(throttle.get_counts([key], 11 * 60), [1.0])
+
+    def test_attempts_counted_atomically(self):
+        throttle = Throttle('login', limit=3, window=60)
+        key = throttle.get_cache_keys(self.request, 'tester')[0]
+        # attempts still being checked elsewhere count straight away
+        name = throttle.get_window_key(key, int(time.time() // 60))
+        cache.add(name, 0)
+        cache.incr(name, 3)
+        self.assertTrue(throttle.attempt(self.request, 'tester'))
+        self.assertEqual(cache.get(name), 4)
+
+    def test_reset(self):
+        throttle = Throttle('login', limit=1, window=60)
+        throttle.attempt(self.request, 'tester')
+        throttle.reset(self.request, 'tester')
+        self.assertFalse(throttle.is_throttled(self.request, 'tester'))
+
+    @override_settings(PROFILES_THROTTLE_BY_IP=True)
+    def test_throttled_by_ip(self):
+        throttle = Throttle('login', limit=2, window=60)
+        throttle.attempt(self.request, 'first')
+        throttle.attempt(self.request, 'second')
+        self.assertTrue(throttle.is_throttled(self.request, 'third'))
+
+        self.request.META['REMOTE_ADDR'] = '10.0.0.2'
+        self.assertFalse(throttle.is_throttled(self.request, 'third'))
+
+    @override_settings(PROFILES_THROTTLES={'login': (1, 30)})
+    def test_limits_from_settings(self):
+        throttle = Throttle('login')
+        self.assertEqual((throttle.limit, throttle.window), (1, 30))
+        self.assertEqual(Throttle('reset_password').limit, 5)
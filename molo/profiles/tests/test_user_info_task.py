@@ -1,10 +1,14 @@
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import random
 from itertools import izip
 from django.test import TestCase, override_settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
+from django.utils import timezone
 from molo.core.tests.base import MoloTestCaseMixin
 from molo.profiles import task
+from molo.profiles.models import DailyUserStats, DailyUserStatsBreakdown
 import responses
 import json
 
@@ -103,7 +107,153 @@ class UserInfoTest(TestCase, MoloTestCaseMixin):
                           "Returning Users: 7"
                           "```"))
 
+    def test_user_stats_counted_in_one_query(self):
+        with self.assertNumQueries(1):
+            stats = task.get_user_stats()
+        self.assertEqual(stats, [{
+            'profile__site': self.site.pk,
+            'total': 20, 'new': 10, 'returning': 7}])
+
+    def test_user_stats_per_site(self):
+        self.mk_main2()
+        user = User.objects.create_user(username='site2user')
+        user.last_login = user.date_joined + timedelta(hours=24)
+        user.save()
+        user.profile.site = self.site2
+        user.profile.save()
+        stats = task.get_user_stats()
+        self.assertEqual(
+            [(row['profile__site'], row['total'], row['new'])
+             for row in stats],
+            [(self.site.pk, 20, 10), (self.site2.pk, 1, 1)])
+
+        # users that joined just over 24 hours ago aren't new
+        stats = task.get_user_stats(
+            now=user.date_joined + timedelta(hours=24, seconds=1))
+        self.assertEqual(stats[1]['new'], 0)
+        self.assertEqual(stats[1]['returning'], 1)
+
+        message = task.get_message_text()
+        self.assertTrue('Total Users: 21\n' in message)
+        self.assertTrue(
+            '%s: 20 total, 10 new, 7 returning\n' % self.site in message)
+        self.assertTrue(
+            '%s: 1 total, 1 new, 0 returning```' % self.site2 in message)
+
     @responses.activate
-    @override_settings(SLACK_INCOMING_WEBHOOK_URL="http://testserver:8080/")
+    @override_settings(SLACK_INCOMING_WEBHOOK_URL="http://testserver:8080/",
+                       CELERY_ALWAYS_EAGER=True)
     def test_send_user_data_to_slack(self):
         task.send_user_data_to_slack()
+
+
+class DailyUserStatsTest(TestCase, MoloTestCaseMixin):
+
+    def setUp(self):
+        self.mk_main()
+        self.mk_main2()
+        self.day = date(2017, 5, 10)
+        self.create_user('old', datetime(2017, 1, 1),
+                         last_login=datetime(2017, 5, 10, 12),
+                         gender='female', date_of_birth=date(1991, 5, 11))
+        self.create_user('inactive', datetime(2017, 1, 1))
+        self.create_user('new', datetime(2017, 5, 10, 0, 30),
+                         last_login=datetime(2017, 5, 10, 0, 30),
+                         gender='male', date_of_birth=date(2001, 1, 1))
+        self.create_user('site2', datetime(2017, 5, 10, 23, 30),
+                         site=self.site2)
+        self.create_user('tomorrow', datetime(2017, 5, 11, 8))
+
+    def create_user(self, username, date_joined, last_login=None,
+                    site=None, **profile_fields):
+        user = User.objects.create_user(username=username)
+        user.date_joined = timezone.make_aware(date_joined)
+        if last_login:
+            user.last_login = timezone.make_aware(last_login)
+        user.save()
+        for name, value in profile_fields.items():
+            setattr(user.profile, name, value)
+        user.profile.site = site or self.site
+        user.profile.save()
+
+    def get_stats(self, day):
+        return dict(
+            (stats.site_id, (stats.total_users, stats.new_users,
+                             stats.returning_users, stats.active_users))
+            for stats in DailyUserStats.objects.filter(date=day))
+
+    def test_rollup(self):
+        task.rollup_daily_user_stats(self.day)
+        self.assertEqual(self.get_stats(self.day), {
+            self.site.pk: (3, 1, 1, 2),
+            self.site2.pk: (1, 1, 0, 0),
+        })
+        breakdowns = DailyUserStats.objects.get(
+            site=self.site, date=self.day).breakdowns.all()
+        self.assertEqual(
+            [(b.field, b.value, b.users) for b in breakdowns], [
+                ('age', '13-17', 1), ('age', '25-34', 1),
+                ('education_level', '', 2),
+                ('gender', 'female', 1), ('gender', 'male', 1),
+                ('location', '', 2)])
+
+        # rolling a day up again replaces its stats
+        task.rollup_daily_user_stats(self.day)
+        self.assertEqual(DailyUserStats.objects.count(), 2)
+        self.assertEqual(DailyUserStatsBreakdown.objects.filter(
+            stats__site=self.site).count(), 6)
+
+        # deleted users are taken off the totals straight away
+        User.objects.get(username='inactive').delete()
+        self.assertEqual(self.get_stats(self.day)[self.site.pk][0], 2)
+
+        # the totals carry on from the day before, without counting every
+        # user, until they're recounted
+        self.create_user('imported', datetime(2016, 1, 1), site=self.site2)
+        next_day = self.day + timedelta(days=1)
+        with CaptureQueriesContext(connection) as queries:
+            rows = list(task.rollup_daily_user_stats(next_day).items())
+        self.assertFalse([
+            query for query in queries.captured_queries
+            if 'COUNT(' in query['sql']])
+        self.assertEqual(
+            sorted(rows), sorted([(self.site.pk, 3), (self.site2.pk, 1)]))
+        self.assertEqual(self.get_stats(next_day), {
+            self.site.pk: (3, 1, 0, 0),
+            self.site2.pk: (1, 0, 0, 0),
+        })
+        task.recount_daily_user_totals()
+        self.assertEqual(self.get_stats(next_day), {
+            self.site.pk: (3, 1, 0, 0),
+            self.site2.pk: (2, 0, 0, 0),
+        })
+
+    def test_update_daily_user_stats(self):
+        yesterday = timezone.localtime(
+            timezone.now()).date() - timedelta(days=1)
+        self.assertEqual(task.update_daily_user_stats(), yesterday)
+        self.assertEqual(
+            set(DailyUserStats.objects.values_list('date', flat=True)),
+            set([yesterday]))
+
+        # each day since the last one rolled up is rolled up
+        DailyUserStats.objects.all().delete()
+        task.rollup_daily_user_stats(yesterday - timedelta(days=3))
+        task.update_daily_user_stats()
+        self.assertEqual(
+            sorted(set(DailyUserStats.objects.values_list(
+                'date', flat=True))),
+            [yesterday - timedelta(days=i) for i in (3, 2, 1, 0)])
+        self.assertEqual(self.get_stats(yesterday)[self.site.pk][0], 4)
+
+    def test_message_from_rollup(self):
+        task.rollup_daily_user_stats(self.day)
+        message = task.get_message_text(
+            task.get_daily_user_stats(self.day), self.day)
+        self.assertTrue(
+            'New User - joined on 2017-05-10\n'
+            'Returning User - joined before 2017-05-10 and visited the site '
+            'on 2017-05-10\n' in message)
+        self.assertTrue('Total Users: 4\nNew Users: 2\n' in message)
+        self.assertTrue(
+            '%s: 1 total, 1 new, 0 returning```' % self.site2 in message)
@@ -3,12 +3,16 @@ from datetime import date, datetime
 
 from django.conf.urls import patterns, url, include
 from django.conf import settings
+from django.contrib.auth.hashers import MD5PasswordHasher
 from django.contrib.auth.models import User
 from django.contrib.auth.tokens import default_token_generator
 
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
+from django.db import connection, transaction
 from django.http import QueryDict
 from django.test import TestCase, override_settings, Client
+from django.test.utils import CaptureQueriesContext
 
 from molo.profiles.forms import (
     RegistrationForm, EditProfileForm,
@@ -36,6 +40,24 @@ urlpatterns = patterns(
 )
 
 
+class CountingPasswordHasher(MD5PasswordHasher):
+    encoded = 0
+
+    def encode(self, *args, **kwargs):
+        CountingPasswordHasher.encoded += 1
+        return super(CountingPasswordHasher, self).encode(*args, **kwargs)
+
+
+def commit():
+    """
+    Run the on_commit callbacks of the test's transaction, which a
+    TestCase never commits.
+    """
+    callbacks, connection.run_on_commit = connection.run_on_commit, []
+    for savepoint_ids, callback in callbacks:
+        callback()
+
+
 @override_settings(
     ROOT_URLCONF='molo.profiles.tests.test_views', LOGIN_URL='/login/')
 class RegistrationViewTest(TestCase, MoloTestCaseMixin):
@@ -852,6 +874,122 @@ class RegistrationViewTest(TestCase, MoloTestCaseMixin):
         )
         self.assertEqual(response.status_code, 200)
 
+    def test_registration_reads_profile_settings_once(self):
+        profile_settings = UserProfilesSettings.for_site(self.main.get_site())
+        profile_settings.show_security_question_fields = True
+        profile_settings.prevent_email_in_username = True
+        profile_settings.save()
+        cache.clear()
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(
+                reverse('molo.profiles:user_register'), {
+                    'username': 'testing',
+                    'password': '1234',
+                    'alias': 'testing',
+                    'question_0': 'answer',
+                    'terms_and_conditions': True
+                })
+        self.assertEqual(response.status_code, 302)
+        settings_queries = [
+            query for query in context.captured_queries
+            if 'profiles_userprofilessettings' in query['sql']]
+        self.assertTrue(len(settings_queries) <= 1)
+
+    def test_registration_writes_each_row_once(self):
+        profile_settings = UserProfilesSettings.for_site(self.main.get_site())
+        profile_settings.show_security_question_fields = True
+        profile_settings.save()
+        question = SecurityQuestion(title="What is your name?")
+        self.security_index.add_child(instance=question)
+        question.save()
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(
+                reverse('molo.profiles:user_register'), {
+                    'username': 'testing',
+                    'password': '1234',
+                    'alias': 'testing',
+                    'question_0': 'answer',
+                    'question_1': 'answer',
+                    'terms_and_conditions': True
+                })
+        self.assertEqual(response.status_code, 302)
+
+        def writes(table):
+            return [
+                query['sql'] for query in context.captured_queries
+                if table in query['sql'] and
+                query['sql'].startswith(('INSERT', 'UPDATE'))]
+
+        self.assertEqual(len(writes('"profiles_userprofile"')), 1)
+        self.assertEqual(len(writes('"profiles_securityanswer"')), 1)
+        # the profile gets the request's site without a default site lookup
+        self.assertFalse([
+            query for query in context.captured_queries
+            if 'WHERE "wagtailcore_site"."is_default_site"' in query['sql']])
+
+        user = User.objects.get(username='testing')
+        self.assertEqual(user.profile.alias, 'testing')
+        self.assertEqual(user.profile.site, self.main.get_site())
+        self.assertEqual(user.profile.securityanswer_set.count(), 2)
+        self.assertTrue(user.profile.securityanswer_set.first().check_answer(
+            'answer'))
+
+    @override_settings(PASSWORD_HASHERS=[
+        'molo.profiles.tests.test_views.CountingPasswordHasher'])
+    def test_registration_hashes_the_password_once(self):
+        CountingPasswordHasher.encoded = 0
+        response = self.client.post(reverse('molo.profiles:user_register'), {
+            'username': 'testing',
+            'password': '1234',
+            'terms_and_conditions': True
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(CountingPasswordHasher.encoded, 1)
+        self.assertEqual(
+            self.client.session['_auth_user_id'],
+            str(User.objects.get(username='testing').pk))
+        self.assertEqual(
+            self.client.session['_auth_user_backend'],
+            'molo.profiles.backends.MoloProfilesModelBackend')
+
+    def test_profile_settings_cache_invalidated_on_save(self):
+        site = self.main.get_site()
+        profile_settings = UserProfilesSettings.for_site(site)
+        self.assertFalse(profile_settings.show_email_field)
+        commit()
+        with self.assertNumQueries(0):
+            UserProfilesSettings.for_site(site)
+        key = UserProfilesSettings.cache_key(site.pk)
+        stale = cache.get(key)
+
+        profile_settings.show_email_field = True
+        profile_settings.save()
+        self.assertTrue(UserProfilesSettings.for_site(site).show_email_field)
+        # another request caches the old settings before the save commits
+        cache.set(key, stale)
+        commit()
+        self.assertTrue(UserProfilesSettings.for_site(site).show_email_field)
+
+    def test_profile_settings_cached_once_committed(self):
+        site = self.main.get_site()
+        key = UserProfilesSettings.cache_key(site.pk)
+        UserProfilesSettings.for_site(site)
+        self.assertEqual(cache.get(key), None)
+        commit()
+        self.assertNotEqual(cache.get(key), None)
+
+        cache.clear()
+        try:
+            with transaction.atomic():
+                UserProfilesSettings.for_site(site)
+                raise ValueError
+        except ValueError:
+            pass
+        commit()
+        self.assertEqual(cache.get(key), None)
+
 
 @override_settings(
     ROOT_URLCONF='molo.profiles.tests.test_views')
@@ -1115,6 +1253,30 @@ class LoginTestView(TestCase, MoloTestCaseMixin):
         self.assertRedirects(
             response, reverse('molo.profiles:login_success'))
 
+    @override_settings(PROFILES_THROTTLES={'login': (3, 60)})
+    def test_login_throttled(self):
+        cache.clear()
+        for i in range(3):
+            response = Client().post(
+                reverse('molo.profiles:auth_login'),
+                data={'username': 'tester', 'password': '0000'})
+            self.assertTrue(response.context['form'].has_error(
+                '__all__', 'invalid_login'))
+
+        # the correct password doesn't help once throttled
+        response = self.client.post(
+            reverse('molo.profiles:auth_login'),
+            data={'username': 'tester', 'password': '1234'})
+        self.assertTrue(response.context['form'].has_error(
+            '__all__', 'throttled'))
+
+        # other users aren't affected
+        User.objects.create_user(username='other', password='1234')
+        response = self.client.post(
+            reverse('molo.profiles:auth_login'),
+            data={'username': 'other', 'password': '1234'})
+        self.assertEqual(response.status_code, 302)
+
 
 @override_settings(
     ROOT_URLCONF='molo.profiles.tests.test_views')
@@ -1537,6 +1699,8 @@ class ProfilePasswordChangeViewTest(TestCase, MoloTestCaseMixin):
 class ForgotPasswordViewTest(TestCase, MoloTestCaseMixin):
 
     def setUp(self):
+        # attempts are throttled in the cache
+        cache.clear()
         self.mk_main()
         self.client = Client()
         self.user = User.objects.create_user(
@@ -1627,6 +1791,24 @@ class ForgotPasswordViewTest(TestCase, MoloTestCaseMixin):
             )
         self.failUnless(error_message in response.content)
 
+    def test_retries_counted_across_sessions(self):
+        site = Site.objects.get(is_default_site=True)
+        profile_settings = UserProfilesSettings.for_site(site)
+
+        for i in range(profile_settings.password_recovery_retries):
+            # a new client for each attempt, without the previous cookies
+            Client().post(
+                reverse("molo.profiles:forgot_password"), {
+                    "username": self.user.username,
+                    "question_0": "200",
+                })
+        response = Client().post(
+            reverse("molo.profiles:forgot_password"), {
+                "username": self.user.username,
+                "question_0": "20",
+            })
+        self.assertContains(response, "Too many attempts")
+
     def test_correct_username_and_answer_results_in_redirect(self):
         response = self.client.post(
             reverse("molo.profiles:forgot_password"), {
@@ -1637,6 +1819,95 @@ class ForgotPasswordViewTest(TestCase, MoloTestCaseMixin):
         )
         self.assertContains(response, "Reset PIN")
 
+    def test_security_answers_checked_in_constant_queries(self):
+        for title in ("What is your name?", "What is your pet name?"):
+            question = SecurityQuestion(title=title)
+            self.security_index.add_child(instance=question)
+            question.save()
+            SecurityAnswer.objects.create(
+                user=self.user.profile, question=question, answer="20")
+        profile_settings = UserProfilesSettings.for_site(self.main.get_site())
+
+        def post_answers():
+            return self.client.post(
+                reverse("molo.profiles:forgot_password"), {
+                    "username": "tester",
+                    "question_0": "20",
+                    "question_1": "20",
+                    "question_2": "20",
+                })
+
+        def count_queries():
+            # the first request after a change to the settings reloads them
+            post_answers()
+            with CaptureQueriesContext(connection) as queries:
+                response = post_answers()
+            self.assertEqual(response.status_code, 302)
+            return len(queries)
+
+        profile_settings.num_security_questions = 1
+        profile_settings.save()
+        one_question = count_queries()
+
+        profile_settings.num_security_questions = 3
+        profile_settings.save()
+        self.assertEqual(count_queries(), one_question)
+
+    def test_security_question_catalog_cached(self):
+        profile_settings = UserProfilesSettings.for_site(self.main.get_site())
+        profile_settings.show_security_question_fields = True
+        profile_settings.save()
+        commit()
+
+        self.client.get(reverse("molo.profiles:forgot_password"))
+        for view in ("molo.profiles:forgot_password",
+                     "molo.profiles:user_register"):
+            self.client.get(reverse(view))
+            commit()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse(view))
+            self.assertContains(response, "How old are you?")
+            self.assertFalse([
+                query for query in queries.captured_queries
+                if 'securityquestion' in query['sql']])
+
+        question = SecurityQuestion(title="What is your name?")
+        self.security_index.add_child(instance=question)
+        question.save_revision().publish()
+        response = self.client.get(reverse("molo.profiles:user_register"))
+        self.assertContains(response, "What is your name?")
+
+        question.unpublish()
+        response = self.client.get(reverse("molo.profiles:user_register"))
+        self.assertNotContains(response, "What is your name?")
+
+        question.save_revision().publish()
+        self.client.get(reverse("molo.profiles:user_register"))
+        question.delete()
+        response = self.client.get(reverse("molo.profiles:user_register"))
+        self.assertNotContains(response, "What is your name?")
+
+    def test_security_question_catalog_rolled_back(self):
+        profile_settings = UserProfilesSettings.for_site(self.main.get_site())
+        profile_settings.show_security_question_fields = True
+        profile_settings.save()
+        commit()
+
+        try:
+            with transaction.atomic():
+                question = SecurityQuestion(title="What is your name?")
+                self.security_index.add_child(instance=question)
+                question.save_revision().publish()
+                response = self.client.get(
+                    reverse("molo.profiles:user_register"))
+                self.assertContains(response, "What is your name?")
+                raise ValueError
+        except ValueError:
+            pass
+        commit()
+        response = self.client.get(reverse("molo.profiles:user_register"))
+        self.assertNotContains(response, "What is your name?")
+
     def test_user_with_no_security_questions(self):
         # register without security questions
         response = self.client.post(
@@ -1826,6 +2097,8 @@ class TranslatedSecurityQuestionsTest(TestCase, MoloTestCaseMixin):
 
 class ResetPasswordViewTest(TestCase, MoloTestCaseMixin):
     def setUp(self):
+        # attempts are throttled in the cache
+        cache.clear()
         self.mk_main()
         self.client = Client()
         self.user = User.objects.create_user(
@@ -0,0 +1,44 @@
+from datetime import date
+
+from django.forms.extras.widgets import SelectDateWidget
+from django.test import TestCase
+from django.utils import timezone, translation
+
+from molo.profiles import widgets
+from molo.profiles.widgets import BirthYears, DateOfBirthWidget
+
+
+class DateOfBirthWidgetTestCase(TestCase):
+
+    def setUp(self):
+        self.years = list(reversed(range(1930, timezone.now().year + 1)))
+
+    def test_renders_like_select_date_widget(self):
+        for is_required in (True, False):
+            widget = DateOfBirthWidget()
+            select_date_widget = SelectDateWidget(years=self.years)
+            widget.is_required = select_date_widget.is_required = is_required
+            for value in (None, date(1990, 2, 3), '1985-12-31'):
+                self.assertEqual(
+                    widget.render('date_of_birth', value),
+                    select_date_widget.render('date_of_birth', value))
+
+    def test_options_rendered_once_per_language(self):
+        widgets._options.clear()
+        widget = DateOfBirthWidget()
+        widget.render('date_of_birth', None)
+        self.assertEqual(len(widgets._options), 3)
+        widget.render('date_of_birth', date(1990, 2, 3))
+        self.assertEqual(len(widgets._options), 3)
+        with translation.override('fr'):
+            html = widget.render('date_of_birth', None)
+        self.assertTrue('>Janvier<' in html)
+        self.assertEqual(len(widgets._options), 6)
+
+    def test_years_follow_the_date(self):
+        years = BirthYears(2000)
+        self.assertEqual(
+            list(years), list(reversed(range(2000, timezone.now().year + 1))))
+        years.today = date(2010, 1, 1)
+        years.years = list(reversed(range(2000, 2011)))
+        self.assertEqual(list(years)[0], timezone.now().year)
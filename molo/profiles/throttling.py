@@ -0,0 +1,108 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.encoding import force_bytes
+
+# (attempts, seconds) allowed per site and username for each scope
+DEFAULT_THROTTLES = {
+    'login': (10, 15 * 60),
+    'forgot_password': (5, 60 * 60),
+    'reset_password': (5, 60 * 60),
+}
+
+
+class Throttle(object):
+    """
+    Counts attempts per site and username, and optionally per client IP
+    address, over a sliding window. A successful attempt resets the count
+    for the username, so only the failed ones are left counting.
+
+    The attempts are kept in the cache rather than the session so that
+    a client can't get a fresh set of attempts by dropping its cookies.
+    Each attempt is recorded before any password or answer is hashed,
+    with an atomic increment, so concurrent attempts can't slip past the
+    limit while the first of them is still being checked.
+
+    Attempts are counted per fixed window, and the sliding window is
+    estimated from the current window's count and the share of the
+    previous window's count that it still overlaps.
+    """
+
+    def __init__(self, scope, limit=None, window=None):
+        default_limit, default_window = getattr(
+            settings, 'PROFILES_THROTTLES', {}).get(
+            scope, DEFAULT_THROTTLES[scope])
+        self.scope = scope
+        self.limit = default_limit if limit is None else limit
+        self.window = default_window if window is None else window
+        self.by_ip = getattr(settings, 'PROFILES_THROTTLE_BY_IP', False)
+
+    def get_cache_keys(self, request, username):
+        prefix = 'molo.profiles.throttle.%s.%s' % (
+            self.scope, request.site.pk)
+        keys = ['%s.user.%s' % (prefix, hashlib.md5(
+            force_bytes(username.lower())).hexdigest())]
+        if self.by_ip and request.META.get('REMOTE_ADDR'):
+            keys.append('%s.ip.%s' % (prefix, request.META['REMOTE_ADDR']))
+        return keys
+
+    def get_window_key(self, key, window):
+        return '%s.%s' % (key, window)
+
+    def get_counts(self, keys, now, current=None):
+        """
+        The estimated attempts in the sliding window ending now for each
+        key. The current window's counts are read from the cache unless
+        they're given.
+        """
+        window, elapsed = divmod(now, self.window)
+        window = int(window)
+        if current is None:
+            counts = cache.get_many([
+                self.get_window_key(key, window) for key in keys])
+            current = dict(
+                (key, counts.get(self.get_window_key(key, window), 0))
+                for key in keys)
+        previous = cache.get_many([
+            self.get_window_key(key, window - 1) for key in keys])
+        overlap = 1 - elapsed / float(self.window)
+        return [
+            previous.get(self.get_window_key(key, window - 1), 0) * overlap +
+            current[key] for key in keys]
+
+    def is_throttled(self, request, username):
+        return any(
+            count >= self.limit for count in self.get_counts(
+                self.get_cache_keys(request, username), time.time()))
+
+    def attempt(self, request, username):
+        """
+        Record an attempt, returning whether it's one too many.
+        """
+        now = time.time()
+        window = int(now // self.window)
+        keys = self.get_cache_keys(request, username)
+        current = {}
+        for key in keys:
+            name = self.get_window_key(key, window)
+            # kept through the next window, which still overlaps this one
+            cache.add(name, 0, self.window * 2)
+            try:
+                current[key] = cache.incr(name)
+            except ValueError:
+                # evicted since it was added
+                cache.add(name, 1, self.window * 2)
+                current[key] = 1
+        return any(
+            count > self.limit
+            for count in self.get_counts(keys, now, current))
+
+    def reset(self, request, username):
+        # attempts from the same address at other usernames still count
+        key = self.get_cache_keys(request, username)[0]
+        window = int(time.time() // self.window)
+        cache.delete_many([
+            self.get_window_key(key, window - 1),
+            self.get_window_key(key, window)])
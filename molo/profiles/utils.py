@@ -0,0 +1,79 @@
+import json
+
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.utils import six
+from django.utils.encoding import force_text
+
+
+def queryset_iterator(queryset, chunk_size=2000):
+    """
+    Iterate over a queryset in primary key ordered chunks.
+
+    Each chunk is fetched with a ``pk > last_pk`` filter rather than an
+    OFFSET so that every query stays cheap no matter how deep into the
+    table we are, and only ``chunk_size`` objects are held in memory.
+    """
+    queryset = queryset.order_by('pk')
+    last_pk = None
+    while True:
+        chunk = queryset
+        if last_pk is not None:
+            chunk = chunk.filter(pk__gt=last_pk)
+        chunk = list(chunk[:chunk_size])
+        if not chunk:
+            return
+        for obj in chunk:
+            yield obj
+        last_pk = chunk[-1].pk
+
+
+def encode_csv_row(row):
+    """
+    Prepare a row for the (bytes only) python 2 csv writer.
+    """
+    encoded = []
+    for value in row:
+        if value is None:
+            value = ''
+        elif not isinstance(value, six.text_type):
+            value = force_text(value)
+        encoded.append(value.encode('utf-8'))
+    return encoded
+
+
+def estimate_count(queryset):
+    """
+    The number of rows in a queryset as estimated by the PostgreSQL query
+    planner, which doesn't have to visit every row like COUNT(*) does.
+    Other databases count the rows.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) %s' % sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, six.string_types):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
+
+
+def cache_on_commit(key, value, timeout):
+    """
+    Cache a value read from the database once the transaction it was read
+    in has committed, or straight away outside of a transaction. Values
+    read in a transaction that's rolled back are never cached.
+    """
+    transaction.on_commit(lambda: cache.set(key, value, timeout))
+
+
+def delete_on_commit(key):
+    """
+    Drop a cached value that a change made stale, straight away and again
+    once the change has committed, so a value other requests cached from
+    the old rows in the meantime doesn't outlive it.
+    """
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
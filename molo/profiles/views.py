@@ -1,5 +1,4 @@
 from django.contrib import messages
-from django.contrib.auth import authenticate
 from django.contrib.auth import login, logout
 from django.contrib.auth.tokens import default_token_generator
 from django.contrib.auth.models import User
@@ -12,10 +11,14 @@ from django.utils.translation import ugettext_lazy as _
 from django.views.generic.base import TemplateView
 from django.views.generic.edit import FormView, UpdateView
 
-from molo.core.templatetags.core_tags import get_pages
 from molo.profiles import forms
+from molo.profiles.backends import get_registration_backend
+from molo.profiles.field_schema import DONE
 from molo.profiles.models import SecurityAnswer, SecurityQuestion
 from molo.profiles.models import UserProfile, UserProfilesSettings
+from molo.profiles.models import register_user
+from molo.profiles.task import queue_post_registration_hooks
+from molo.profiles.throttling import Throttle
 
 
 class RegistrationView(FormView):
@@ -28,49 +31,28 @@ class RegistrationView(FormView):
     def form_valid(self, form):
         username = form.cleaned_data["username"]
         password = form.cleaned_data["password"]
-        alias = form.cleaned_data["alias"]
-        date_of_birth = form.cleaned_data["date_of_birth"]
-        gender = form.cleaned_data["gender"]
-        location = form.cleaned_data["location"]
-        education_level = form.cleaned_data["education_level"]
-        mobile_number = form.cleaned_data["mobile_number"]
-        user = User.objects.create_user(username=username, password=password)
-        user.profile.mobile_number = mobile_number
-        user.profile.alias = alias
-        user.profile.date_of_birth = date_of_birth
-        user.profile.gender = gender
-        user.profile.location = location
-        user.profile.education_level = education_level
-        user.profile.site = self.request.site
-        if form.cleaned_data["email"]:
-            user.email = form.cleaned_data["email"]
-            user.save()
-        user.profile.save()
-
-        for index, question in enumerate(self.questions):
-            answer = form.cleaned_data["question_%s" % index]
-            if answer:
-                SecurityAnswer.objects.create(
-                    user=user.profile,
-                    question=question,
-                    answer=answer
-                )
-        authed_user = authenticate(
-            request=self.request, username=username, password=password)
-        login(self.request, authed_user)
+        user = register_user(
+            self.request.site, username, password,
+            email=form.cleaned_data["email"] or '',
+            security_answers=[
+                (question.pk, form.cleaned_data["question_%s" % index])
+                for index, question in enumerate(self.questions)],
+            alias=form.cleaned_data["alias"],
+            date_of_birth=form.cleaned_data["date_of_birth"],
+            gender=form.cleaned_data["gender"],
+            location=form.cleaned_data["location"],
+            education_level=form.cleaned_data["education_level"],
+            mobile_number=form.cleaned_data["mobile_number"])
+        queue_post_registration_hooks(user)
+        # we've just set the password, there's no need to check it again
+        user.backend = get_registration_backend()
+        login(self.request, user)
         return HttpResponseRedirect(form.cleaned_data.get("next", "/"))
 
     def get_form_kwargs(self):
         kwargs = super(RegistrationView, self).get_form_kwargs()
-        self.questions = SecurityQuestion.objects.descendant_of(
-            self.request.site.root_page).live().filter(
-            languages__language__is_main_language=True)
-
-        # create context dictionary with request for get_pages()
-        request = {"request": self.request}
-        self.translated_questions = get_pages(
-            request, self.questions, self.request.LANGUAGE_CODE)
-        kwargs["questions"] = self.translated_questions
+        self.questions = SecurityQuestion.catalog_for_request(self.request)
+        kwargs["questions"] = self.questions
         kwargs["request"] = self.request
         return kwargs
 
@@ -81,31 +63,8 @@ class RegistrationDone(FormView):
 
     def form_valid(self, form):
         profile = self.request.user.profile
-        if (UserProfilesSettings.for_site(
-            self.request.site).activate_dob) and not (
-            UserProfilesSettings.for_site(
-                self.request.site).capture_dob_on_reg):
-                profile.date_of_birth = form.cleaned_data["date_of_birth"]
-        if (UserProfilesSettings.for_site(
-            self.request.site).activate_display_name) and not (
-            UserProfilesSettings.for_site(
-                self.request.site).capture_display_name_on_reg):
-                profile.alias = form.cleaned_data["alias"]
-        if (UserProfilesSettings.for_site(
-            self.request.site).activate_gender) and not (
-            UserProfilesSettings.for_site(
-                self.request.site).capture_gender_on_reg):
-                profile.gender = form.cleaned_data["gender"]
-        if (UserProfilesSettings.for_site(
-            self.request.site).activate_location) and not (
-            UserProfilesSettings.for_site(
-                self.request.site).capture_location_on_reg):
-                profile.location = form.cleaned_data["location"]
-        if (UserProfilesSettings.for_site(
-            self.request.site).activate_education_level) and not (
-            UserProfilesSettings.for_site(
-                self.request.site).capture_education_level_on_reg):
-                profile.education_level = form.cleaned_data["education_level"]
+        for name in form.validation_context.field_schema.fields[DONE]:
+            setattr(profile, name, form.cleaned_data[name])
         profile.save()
         return HttpResponseRedirect(form.cleaned_data.get('next', '/'))
 
@@ -184,21 +143,20 @@ class ForgotPasswordView(FormView):
     def form_valid(self, form):
         error_message = "The username and security question(s) combination " \
                         + "do not match."
-        profile_settings = UserProfilesSettings.for_site(self.request.site)
-
-        if "forgot_password_attempts" not in self.request.session:
-            self.request.session["forgot_password_attempts"] = \
-                profile_settings.password_recovery_retries
+        profile_settings = UserProfilesSettings.for_request(self.request)
+        username = form.cleaned_data["username"]
+        throttle = Throttle(
+            'forgot_password',
+            limit=profile_settings.password_recovery_retries)
 
         # max retries exceeded
-        if self.request.session["forgot_password_attempts"] <= 0:
+        if throttle.attempt(self.request, username):
             form.add_error(
                 None,
                 _("Too many attempts. Please try again later.")
             )
             return self.render_to_response({'form': form})
 
-        username = form.cleaned_data["username"]
         try:
             user = User.objects.get(
                 profile__migrated_username=username,
@@ -209,7 +167,6 @@ class ForgotPasswordView(FormView):
                 user = User.objects.get(
                     username=username, profile__site=self.request.site)
             except User.DoesNotExist:
-                self.request.session['forgot_password_attempts'] += 1
                 form.add_error('username',
                                _('The username that you entered appears to be '
                                  'invalid. Please try again.'))
@@ -218,29 +175,31 @@ class ForgotPasswordView(FormView):
         if not user.is_active:
             # add non_field_error
             form.add_error(None, _(error_message))
-            self.request.session["forgot_password_attempts"] -= 1
             return self.render_to_response({'form': form})
 
-        # check security question answers
-        answer_checks = []
-        for i in range(profile_settings.num_security_questions):
-            user_answer = form.cleaned_data["question_%s" % (i,)]
-            try:
-                saved_answer = user.profile.securityanswer_set.get(
-                    user=user.profile,
-                    question=self.security_questions[i]
-                )
-                answer_checks.append(saved_answer.check_answer(user_answer))
-            except SecurityAnswer.DoesNotExist:
-                form.add_error(
-                    None,
-                    _("There are no security questions "
-                      "stored against your profile."))
-                return self.render_to_response({'form': form})
+        # check security question answers, fetching all the saved answers
+        # in one query and stopping at the first one that doesn't match
+        questions = self.security_questions
+        saved_answers = dict(
+            (answer.question_id, answer)
+            for answer in SecurityAnswer.objects.filter(
+                user_id=user.pk,
+                question_id__in=[question.pk for question in questions]))
+        if any(question.pk not in saved_answers for question in questions):
+            form.add_error(
+                None,
+                _("There are no security questions "
+                  "stored against your profile."))
+            return self.render_to_response({'form': form})
+        answers_match = all(
+            saved_answers[question.pk].check_answer(
+                form.cleaned_data["question_%s" % (i,)])
+            for i, question in enumerate(questions))
 
         # redirect to reset password page if username and security
         # questions were matched
-        if all(answer_checks):
+        if answers_match:
+            throttle.reset(self.request, form.cleaned_data["username"])
             token = default_token_generator.make_token(user)
             q = QueryDict(mutable=True)
             q["user"] = username
@@ -251,7 +210,6 @@ class ForgotPasswordView(FormView):
             return HttpResponseRedirect(reset_password_url)
         else:
             form.add_error(None, _(error_message))
-            self.request.session["forgot_password_attempts"] -= 1
             return self.render_to_response({'form': form})
 
     def get_form_kwargs(self):
@@ -259,23 +217,10 @@ class ForgotPasswordView(FormView):
         # the security questions should be a random subset of
         # all the questions the user has answered
         kwargs = super(ForgotPasswordView, self).get_form_kwargs()
-        profile_settings = UserProfilesSettings.for_site(self.request.site)
-        self.security_questions = SecurityQuestion.objects.descendant_of(
-            self.request.site.root_page).live().filter(
-            languages__language__is_main_language=True
-        )
-
-        # create context dictionary with request for get_pages()
-        request = {"request": self.request}
-        translated_questions = get_pages(
-            request, self.security_questions, self.request.LANGUAGE_CODE
-        )
-        kwargs["questions"] = translated_questions[
-            :profile_settings.num_security_questions]
-        # limit security questions - done here because query in get_pages()
-        # cannot be performed once queryset is sliced
-        self.security_questions = self.security_questions[
-            :profile_settings.num_security_questions]
+        profile_settings = UserProfilesSettings.for_request(self.request)
+        self.security_questions = SecurityQuestion.catalog_for_request(
+            self.request)[:profile_settings.num_security_questions]
+        kwargs["questions"] = self.security_questions
         return kwargs
 
 
@@ -286,6 +231,10 @@ class ResetPasswordView(FormView):
     def form_valid(self, form):
         username = form.cleaned_data["username"]
         token = form.cleaned_data["token"]
+        throttle = Throttle('reset_password')
+
+        if throttle.attempt(self.request, username):
+            return HttpResponseForbidden()
 
         try:
             user = User.objects.get_by_natural_key(username)
@@ -309,6 +258,7 @@ class ResetPasswordView(FormView):
 
         user.set_password(password)
         user.save()
+        throttle.reset(self.request, username)
         self.request.session.flush()
 
         return HttpResponseRedirect(
@@ -1,5 +1,8 @@
+from django.conf.urls import url
 from django.shortcuts import render
-from molo.profiles.admin import FrontendUsersModelAdmin, UserProfileModelAdmin
+from molo.profiles.admin_views import export_download
+from molo.profiles.admin import (
+    FrontendUsersModelAdmin, UserProfileModelAdmin, DailyUserStatsModelAdmin)
 from molo.profiles.models import (
     UserProfilesSettings, UserProfile, SecurityAnswer)
 from wagtail.contrib.modeladmin.options import modeladmin_register
@@ -14,7 +17,7 @@ class ProfileWarningMessagee(SummaryItem):
 
 @hooks.register('construct_homepage_panels')
 def profile_warning_message(request, panels):
-    profile_settings = UserProfilesSettings.for_site(request.site)
+    profile_settings = UserProfilesSettings.for_request(request)
     if not profile_settings.country_code and \
             profile_settings.show_mobile_number_field:
         panels[:] = [ProfileWarningMessagee(request)]
@@ -22,6 +25,7 @@ def profile_warning_message(request, panels):
 
 modeladmin_register(FrontendUsersModelAdmin)
 modeladmin_register(UserProfileModelAdmin)
+modeladmin_register(DailyUserStatsModelAdmin)
 
 
 class AccessErrorMessage(SummaryItem):
@@ -46,3 +50,11 @@ def before_delete_security_question(request, page):
                 'page': page,
                 'parent_id': page.get_parent().id
             })
+
+
+@hooks.register('register_admin_urls')
+def register_export_download_url():
+    return [
+        url(r'^profiles/exports/(?P<token>[^/]+)/$', export_download,
+            name='molo_profiles_export_download'),
+    ]
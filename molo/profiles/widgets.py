@@ -0,0 +1,76 @@
+from django.forms.extras.widgets import SelectDateWidget
+from django.forms.utils import flatatt
+from django.utils import timezone
+from django.utils.encoding import force_text
+from django.utils.html import conditional_escape, format_html
+from django.utils.safestring import mark_safe
+from django.utils.translation import get_language
+
+# rendered options by language, select and range of choices
+_options = {}
+
+
+class BirthYears(object):
+    """
+    The years from first_year up to the current year, most recent first.
+
+    They're worked out when they're used rather than when the form is
+    defined, and kept for the rest of the day, so they don't go stale at
+    New Year.
+    """
+
+    def __init__(self, first_year=1930):
+        self.first_year = first_year
+        self.today = None
+        self.years = []
+
+    def get_years(self):
+        today = timezone.now().date()
+        if today != self.today:
+            self.years = list(reversed(range(self.first_year, today.year + 1)))
+            self.today = today
+        return self.years
+
+    def __iter__(self):
+        return iter(self.get_years())
+
+    def __len__(self):
+        return len(self.get_years())
+
+
+class DateOfBirthWidget(SelectDateWidget):
+    """
+    Year, month and day selects for a date of birth.
+
+    The options of each select only depend on the language and the range
+    of years, so they're rendered once and only the selected option is
+    marked on each render.
+    """
+
+    def __init__(self, attrs=None, first_year=1930, **kwargs):
+        super(DateOfBirthWidget, self).__init__(
+            attrs=attrs, years=BirthYears(first_year), **kwargs)
+
+    def create_select(self, name, field, value, val, choices, none_value):
+        if 'id' in self.attrs:
+            id_ = self.attrs['id']
+        else:
+            id_ = 'id_%s' % name
+        if not self.is_required:
+            choices.insert(0, none_value)
+
+        key = (get_language(), field, choices[0], choices[-1], len(choices))
+        options = _options.get(key)
+        if options is None:
+            options = _options[key] = self.select_widget(
+                choices=choices).render_options([], [])
+        if val is not None:
+            option = '<option value="%s">' % conditional_escape(
+                force_text(val))
+            options = options.replace(
+                option, '%s selected="selected">' % option[:-1], 1)
+
+        attrs = self.build_attrs(
+            self.build_attrs(id=field % id_), name=field % name)
+        return mark_safe('\n'.join([
+            format_html('<select{}>', flatatt(attrs)), options, '</select>']))